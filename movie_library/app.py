@@ -1,52 +1,518 @@
-import os, sqlite3
+import os, sqlite3, json, threading, queue, base64, hashlib, re, unicodedata, html, csv, io, tarfile, gzip, zlib, tempfile
+import xml.etree.ElementTree as ET
+import fcntl
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from werkzeug.utils import secure_filename
-from flask import Flask, request, jsonify, render_template_string, redirect, url_for
-from time import time
+from werkzeug.security import safe_join
+from flask import Flask, request, jsonify, redirect, url_for, Response
+from time import time, monotonic, sleep
+from datetime import datetime
+from collections import OrderedDict
+from dataclasses import dataclass
+from contextlib import contextmanager
 from pathlib import Path
 from urllib.parse import urlparse
-from flask import send_from_directory
+from flask import send_file
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError, wait
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # utan Pillow serveras bara originalfilerna
+    Image = None
+
+try:
+    import brotli
+except ImportError:  # utan brotli används gzip
+    brotli = None
 
 
 app = Flask(__name__)
 DB_PATH = "/config/movies.db"
+POSTERS_DIR = Path("/config/movie_library/posters")
+
+# Återanvända SQLite-anslutningar (WAL: läsare blockeras aldrig av en skrivare)
+DB_POOL_SIZE = 8
+_db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+def fold(s: str) -> str:
+    """Gemener utan diakriter, tecken för tecken (samma längd som indata)."""
+    if not s:
+        return ""
+    out = []
+    for ch in s:
+        base = "".join(c for c in unicodedata.normalize("NFD", ch) if not unicodedata.combining(c)).lower()
+        out.append(base if len(base) == 1 else ch)
+    return "".join(out)
+
+def _open_db():
+    conn = sqlite3.connect(DB_PATH, timeout=5, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA mmap_size=67108864")  # 64 MB
+    conn.execute("PRAGMA cache_size=-8000")    # ~8 MB
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+@contextmanager
+def db():
+    """Lånar en anslutning ur poolen; ej committade ändringar rullas tillbaka."""
+    try:
+        conn = _db_pool.get_nowait()
+    except queue.Empty:
+        conn = _open_db()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _db_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
 
 # Home Assistant add-on options hamnar i /data/options.json
 OPTIONS_PATH = "/data/options.json"
 
-_tmdb_cache = {}  # movie_id -> (expires_ts, payload)
+# Runtime-uppslag i sökningen körs parallellt i en begränsad pool
+ENRICH_WORKERS = 4
+ENRICH_DEADLINE = 8  # sekunder för hela enrich-steget
+_enrich_pool = ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix="tmdb-enrich")
+# Cacheuppvärmning köar hundratals uppslag; egen smal pool så att sökningen inte får vänta
+WARM_WORKERS = 2
+_warm_pool = ThreadPoolExecutor(max_workers=WARM_WORKERS, thread_name_prefix="tmdb-warm")
+POSTER_WORKERS = 2  # posternedladdningar
+IMPORT_WORKERS = 4  # TMDB-matchning i bulkimporten
+_shutting_down = threading.Event()  # sätts av stop_background_tasks; bakgrundsjobb avbryts
+
+def _opt_int(opts: dict, key: str, default: int, lo: int, hi: int) -> int:
+    try:
+        return min(hi, max(lo, int(opts.get(key, default))))
+    except (TypeError, ValueError):
+        return default
+
+@dataclass(frozen=True)
+class Options:
+    tmdb_token: str = ""
+    tmdb_language: str = "sv-SE"
+    server: str = "gunicorn"  # "gunicorn" eller "development" (Werkzeug)
+    workers: int = 1
+    threads: int = 8
+    worker_timeout: int = 60
+
+    @classmethod
+    def from_dict(cls, opts: dict):
+        return cls(
+            tmdb_token=(opts.get("tmdb_token") or "").strip(),
+            tmdb_language=(opts.get("tmdb_language") or "sv-SE").strip(),
+            server=(opts.get("server") or "gunicorn").strip(),
+            workers=_opt_int(opts, "workers", 1, 1, 8),
+            threads=_opt_int(opts, "threads", 8, 1, 64),
+            worker_timeout=_opt_int(opts, "worker_timeout", 60, 10, 600),
+        )
+
+# Options läses om bara när filen ändrats (mtime/storlek), och stat:as högst en gång per sekund
+_options = Options()
+_options_sig = None
+_options_checked = 0.0
+_options_lock = threading.Lock()
 
 def load_options():
     try:
-        import json
         with open(OPTIONS_PATH, "r", encoding="utf-8") as f:
             return json.load(f)
     except Exception:
         return {}
 
+def options() -> Options:
+    global _options, _options_sig, _options_checked
+    now = time()
+    if now - _options_checked < 1.0:
+        return _options
+    with _options_lock:
+        _options_checked = now
+        try:
+            st = os.stat(OPTIONS_PATH)
+            sig = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            sig = None
+        if sig != _options_sig:
+            _options = Options.from_dict(load_options()) if sig else Options()
+            _options_sig = sig
+    return _options
+
 def tmdb_headers():
-    opts = load_options()
-    token = (opts.get("tmdb_token") or "").strip()
+    token = options().tmdb_token
     if not token:
         return None, "TMDB-token saknas. Lägg in den i appens konfiguration."
     return {"Authorization": f"Bearer {token}"}, None
 
 def tmdb_language():
-    opts = load_options()
-    return (opts.get("tmdb_language") or "sv-SE").strip()
+    return options().tmdb_language
+
+class TmdbLru:
+    """Trådsäker LRU med en sammanslagen post per film och TTL per post.
+
+    Post: {"runtime": ..., "details": {...}} – sök och detaljvy skriver
+    olika fält i samma post utan att skriva över varandra.
+    """
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # movie_id -> (expires_ts, record)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, movie_id: int):
+        with self._lock:
+            item = self._data.get(movie_id)
+            if item is None:
+                self.misses += 1
+                return None
+            exp, record = item
+            if time() > exp:
+                del self._data[movie_id]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(movie_id)
+            self.hits += 1
+            return dict(record)
+
+    def merge(self, movie_id: int, fields: dict, ttl_seconds: int):
+        with self._lock:
+            item = self._data.get(movie_id)
+            record = dict(item[1]) if item and time() <= item[0] else {}
+            record.update(fields)
+            self._data[movie_id] = (time() + ttl_seconds, record)
+            self._data.move_to_end(movie_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, movie_id: int = None) -> int:
+        with self._lock:
+            if movie_id is None:
+                n = len(self._data)
+                self._data.clear()
+                return n
+            return 1 if self._data.pop(movie_id, None) is not None else 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+    def entries(self) -> list:
+        now = time()
+        with self._lock:
+            return [
+                {"id": k, "ttl": round(exp - now), "fields": sorted(rec)}
+                for k, (exp, rec) in self._data.items()
+            ]
+
+TMDB_LRU_SIZE = 512
+_tmdb_cache = TmdbLru(maxsize=TMDB_LRU_SIZE)
 
 def _cache_get(movie_id: int):
-    item = _tmdb_cache.get(movie_id)
-    if not item:
+    return _tmdb_cache.get(movie_id)
+
+def _cache_set(movie_id: int, payload: dict, ttl_seconds: int = 3600):
+    _tmdb_cache.merge(movie_id, payload, ttl_seconds)
+
+# Persistent TMDB-cache i movies.db (överlever omstarter, delas mellan processer).
+# Utgångna rader serveras ändå (stale-while-revalidate) och förnyas i bakgrunden.
+TMDB_CACHE_TTL = 7 * 24 * 3600
+TMDB_CACHE_KEEP = 30 * 24 * 3600  # så länge efter utgång en rad utanför biblioteket sparas
+_refreshing = set()  # (tmdb_id, language) som håller på att förnyas
+_refreshing_lock = threading.Lock()
+
+def _pcache_get(tmdb_id: int, language: str):
+    """Returnerar (details, fresh) eller None om raden saknas."""
+    try:
+        with db() as conn:
+            row = conn.execute(
+                "SELECT payload, expires_at FROM tmdb_cache WHERE tmdb_id=? AND language=?",
+                (tmdb_id, language)
+            ).fetchone()
+    except sqlite3.Error:
         return None
-    exp, payload = item
-    if time() > exp:
-        _tmdb_cache.pop(movie_id, None)
+    if not row:
         return None
-    return payload
+    return json.loads(row[0]), time() < row[1]
 
-def _cache_set(movie_id: int, payload: dict, ttl_seconds: int = 3600):
-    _tmdb_cache[movie_id] = (time() + ttl_seconds, payload)
+def _pcache_set(tmdb_id: int, language: str, details: dict, ttl_seconds: int = TMDB_CACHE_TTL):
+    now = time()
+    try:
+        with db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tmdb_cache (tmdb_id, language, payload, fetched_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (tmdb_id, language, json.dumps(details, ensure_ascii=False), now, now + ttl_seconds)
+            )
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+def prune_tmdb_cache():
+    """Tar bort rader som gått ut för länge sedan (mest sökträffar som aldrig lades till).
+
+    Filmer i biblioteket behålls: en gammal rad är bättre än ingen när TMDB inte svarar."""
+    try:
+        with db() as conn:
+            conn.execute(
+                "DELETE FROM tmdb_cache WHERE expires_at < ? "
+                "AND tmdb_id NOT IN (SELECT tmdb_id FROM movies WHERE tmdb_id IS NOT NULL)",
+                (time() - TMDB_CACHE_KEEP,)
+            )
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+def _tmdb_details(j: dict) -> dict:
+    # Det vi sparar av /movie/{id}
+    return {
+        "overview": (j.get("overview") or "").strip() or None,
+        "runtime": j.get("runtime"),
+        "release_date": j.get("release_date"),
+        "genres": [g.get("name") for g in (j.get("genres") or []) if g.get("name")],
+        "vote": j.get("vote_average"),
+    }
+
+TMDB_API = "https://api.themoviedb.org/3"
+TMDB_IMG = "https://image.tmdb.org/t/p"
+
+class TmdbClient:
+    """Delad HTTP-klient mot TMDB: keep-alive per värd, retry med backoff."""
+
+    # (connect, read) i sekunder
+    API_TIMEOUT = (3.05, 10)
+    IMG_TIMEOUT = (3.05, 15)
+
+    def __init__(self, pool_size: int = 8):
+        retry = Retry(
+            total=3,
+            connect=2,
+            read=0,  # en timeout efter skickad fråga upprepas inte (10 s per försök)
+            status=3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            backoff_factor=0.5,
+            backoff_jitter=0.3,
+            backoff_max=8,
+            respect_retry_after_header=True,
+            raise_on_status=False,  # sista svaret returneras, routes kollar status_code
+        )
+        # En pool per värd (api.themoviedb.org, image.tmdb.org)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+
+    def get(self, path: str, headers: dict, params: dict = None):
+        return self.session.get(f"{TMDB_API}{path}", headers=headers, params=params, timeout=self.API_TIMEOUT)
+
+    def image(self, size: str, poster_path: str, stream: bool = False):
+        return self.session.get(f"{TMDB_IMG}/{size}{poster_path}", timeout=self.IMG_TIMEOUT, stream=stream)
+
+# Alla trådar som kan anropa TMDB samtidigt: request-trådarna, poolerna och
+# bakgrundstråden. En för liten pool kastar anslutningar i stället för att återanvända dem.
+tmdb = TmdbClient(
+    pool_size=options().threads + ENRICH_WORKERS + WARM_WORKERS + POSTER_WORKERS + IMPORT_WORKERS + 1
+)
+
+class SingleFlight:
+    """Samtidiga anrop med samma nyckel delar på ett anrop (resultat eller undantag)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # nyckel -> Future
+
+    def do(self, key, fn):
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._calls[key] = Future()
+        if leader:
+            try:
+                fut.set_result(fn())
+            except BaseException as e:
+                fut.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+        return fut.result()
+
+class KeyedLocks:
+    """Ett lås per nyckel; låset finns bara kvar medan någon håller eller väntar på det."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}  # nyckel -> [Lock, antal användare]
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+# Nyckel (endpoint, TMDB-id, språk): två dashboards som öppnar samma film ger ett anrop
+_tmdb_flight = SingleFlight()
+_add_locks = KeyedLocks()
+
+def _tmdb_movie(movie_id: int, headers: dict, language: str, append: str = ""):
+    """(status, json) för /movie/{id}; json är None om status inte är 200."""
+    params = {"language": language}
+    if append:
+        params["append_to_response"] = append
+
+    def fetch():
+        r = tmdb.get(f"/movie/{movie_id}", headers, params)
+        return r.status_code, (r.json() if r.status_code == 200 else None)
+
+    return _tmdb_flight.do((f"/movie?{append}", movie_id, language), fetch)
+
+def _fetch_details(movie_id: int, headers: dict, language: str):
+    # Hämtar /movie/{id} och skriver till båda cacharna; None vid fel
+    def fetch():
+        status, j = _tmdb_movie(movie_id, headers, language)
+        if status != 200:
+            return None
+        details = _tmdb_details(j)
+        _pcache_set(movie_id, language, details)
+        _cache_set(movie_id, {"runtime": details["runtime"], "details": details})
+        return details
+
+    # Egen nyckel så att cacharna skrivs en gång även när flera väntar
+    return _tmdb_flight.do(("details", movie_id, language), fetch)
+
+def _fetch_runtime(movie_id: int, headers: dict, language: str):
+    # Körs i _enrich_pool
+    details = _fetch_details(movie_id, headers, language)
+    return details["runtime"] if details is not None else None
+
+def _refresh_in_background(movie_id: int, headers: dict, language: str, pool=_enrich_pool):
+    key = (movie_id, language)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            _fetch_details(movie_id, headers, language)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    try:
+        pool.submit(run)
+    except RuntimeError:
+        # poolen är nedstängd
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+# ===== TMDB-sökcache =====
+# Sök-medan-du-skriver ger en fråga per paus i skrivandet. Svaren cachas per
+# (normaliserad fråga, språk); en längre fråga kan filtreras fram ur en kortare
+# frågas svar om det svaret innehöll alla TMDB:s träffar.
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_TTL = 600        # sekunder
+SEARCH_PREFIX_MIN = 2         # kortaste prefix som återanvänds
+SEARCH_LIVE_DEADLINE = 0.8    # enrich-väntan när klienten söker medan man skriver
+
+class TmdbSearchCache:
+    """Trådsäker LRU med TTL: (fråga, språk) -> {"results": [...], "complete": bool}."""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # nyckel -> (expires_ts, post)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if time() > item[0]:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def put(self, key, entry: dict):
+        with self._lock:
+            self._data[key] = (time() + self.ttl, entry)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def complete_prefix(self, q: str, language: str):
+        """Längsta cachade prefix till q vars svar innehöll alla träffar."""
+        for n in range(len(q) - 1, SEARCH_PREFIX_MIN - 1, -1):
+            entry = self.get((q[:n], language))
+            if entry is not None and entry["complete"]:
+                return entry
+        return None
+
+_search_cache = TmdbSearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
+def _search_key(q: str) -> str:
+    return " ".join(fold(q).split())
+
+def _tmdb_search(q: str, headers: dict, language: str):
+    """(status, träffar) för /search/movie – cache, prefixfiltrering, sedan TMDB."""
+    key = (_search_key(q), language)
+    entry = _search_cache.get(key)
+    if entry is not None:
+        return 200, entry["results"]
+
+    prefix = _search_cache.complete_prefix(*key)
+    if prefix is not None:
+        words = key[0].split()
+        results = []
+        for m in prefix["results"]:
+            # Varje ord i frågan ska börja något ord i titeln/originaltiteln
+            title_words = fold(f"{m.get('title') or ''} {m.get('original_title') or ''}").split()
+            if all(any(t.startswith(w) for t in title_words) for w in words):
+                results.append(m)
+        if results:
+            # Delmängd av en fullständig lista är också fullständig
+            _search_cache.put(key, {"results": results, "complete": True})
+            return 200, results
+
+    def fetch():
+        r = tmdb.get("/search/movie", headers, {"query": q, "language": language, "include_adult": "false"})
+        if r.status_code != 200:
+            return r.status_code, None
+        j = r.json()
+        results = j.get("results") or []
+        complete = (j.get("total_results") or 0) <= len(results)
+        _search_cache.put(key, {"results": results, "complete": complete})
+        return 200, results
+
+    return _tmdb_flight.do(("/search/movie",) + key, fetch)
 
 @app.route("/tmdb/search_enriched")
 def tmdb_search_enriched():
@@ -54,19 +520,46 @@ def tmdb_search_enriched():
     if err:
         return jsonify({"error": err}), 400
 
-    q = (request.args.get("q") or "").strip()
+    q = " ".join((request.args.get("q") or "").split())
     if not q:
         return jsonify({"results": []})
+    live = request.args.get("live") == "1"
+    language = tmdb_language()
 
     # 1) Sök
-    url = "https://api.themoviedb.org/3/search/movie"
-    params = {"query": q, "language": tmdb_language(), "include_adult": "false"}
-    r = requests.get(url, headers=headers, params=params, timeout=10)
-    if r.status_code != 200:
-        return jsonify({"error": f"TMDB-sök misslyckades ({r.status_code})"}), 502
+    status, results = _tmdb_search(q, headers, language)
+    if status != 200:
+        return jsonify({"error": f"TMDB-sök misslyckades ({status})"}), 502
+
+    base_results = results[:8]  # vi enrichar topp 8
+
+    # 2) Runtime kräver detaljer – cachade svar direkt, resten parallellt
+    runtimes = {}
+    pending = {}
+    for item in base_results:
+        movie_id = item.get("id")
+        if not movie_id or movie_id in runtimes or movie_id in pending:
+            continue
+        cached = _cache_get(movie_id)
+        if cached is not None:
+            runtimes[movie_id] = cached.get("runtime")
+            continue
+        stored = _pcache_get(movie_id, language)
+        if stored is not None:
+            details, fresh = stored
+            runtimes[movie_id] = details.get("runtime")
+            if not fresh:
+                _refresh_in_background(movie_id, headers, language)
+        else:
+            pending[movie_id] = _enrich_pool.submit(_fetch_runtime, movie_id, headers, language)
 
-    j = r.json()
-    base_results = j.get("results", [])[:8]  # vi enrichar topp 8
+    if pending:
+        # Gemensam deadline: filmer som inte hunnit svara får runtime=None.
+        # Medan man skriver väntar vi kort; hämtningarna fyller cachen ändå.
+        done, _ = wait(pending.values(), timeout=SEARCH_LIVE_DEADLINE if live else ENRICH_DEADLINE)
+        for movie_id, fut in pending.items():
+            if fut in done and fut.exception() is None:
+                runtimes[movie_id] = fut.result()
 
     out = []
     for item in base_results:
@@ -79,21 +572,7 @@ def tmdb_search_enriched():
         vote = item.get("vote_average")
         poster = item.get("poster_path")
 
-        poster_url = f"https://image.tmdb.org/t/p/w185{poster}" if poster else None
-
-        # 2) Runtime kräver detaljer – cacha 1h
-        cached = _cache_get(movie_id) if movie_id else None
-        runtime = None
-        if cached is not None:
-            runtime = cached.get("runtime")
-        elif movie_id:
-            durl = f"https://api.themoviedb.org/3/movie/{movie_id}"
-            dparams = {"language": tmdb_language()}
-            dr = requests.get(durl, headers=headers, params=dparams, timeout=10)
-            if dr.status_code == 200:
-                dj = dr.json()
-                runtime = dj.get("runtime")
-                _cache_set(movie_id, {"runtime": runtime})
+        poster_url = f"{TMDB_IMG}/w185{poster}" if poster else None
 
         out.append({
             "id": movie_id,
@@ -102,45 +581,516 @@ def tmdb_search_enriched():
             "year": year,
             "overview": overview,
             "vote": vote,
-            "runtime": runtime,     # minuter
+            "runtime": runtimes.get(movie_id),     # minuter
             "poster": poster_url
         })
 
     return jsonify({"results": out})
 
+# LRU:n finns per process. Med workers > 1 i gunicorn påverkar /admin/tmdb_cache*
+# bara den worker som svarar; "pid" i svaret visar vilken. tmdb_cache-tabellen
+# delas däremot av alla och fylls på av warm oavsett vilken worker som kör.
+@app.get("/admin/tmdb_cache")
+def admin_tmdb_cache():
+    return jsonify({"pid": os.getpid(), "stats": _tmdb_cache.stats(), "entries": _tmdb_cache.entries()})
+
+@app.post("/admin/tmdb_cache/invalidate")
+def admin_tmdb_cache_invalidate():
+    movie_id = (request.values.get("id") or "").strip()
+    if movie_id and not movie_id.isdigit():
+        return jsonify({"error": "Ogiltigt id"}), 400
+    n = _tmdb_cache.invalidate(int(movie_id) if movie_id else None)
+    return jsonify({"pid": os.getpid(), "invalidated": n})
+
+@app.post("/admin/tmdb_cache/warm")
+def admin_tmdb_cache_warm():
+    # Värm LRU:n med bibliotekets filmer: från tmdb_cache om möjligt, annars TMDB
+    headers, err = tmdb_headers()
+    language = tmdb_language()
+
+    with db() as conn:
+        ids = [r[0] for r in conn.execute(
+            "SELECT tmdb_id FROM movies WHERE tmdb_id IS NOT NULL ORDER BY added_at DESC LIMIT ?",
+            (TMDB_LRU_SIZE,)
+        )]
+
+    loaded = queued = 0
+    for tmdb_id in ids:
+        stored = _pcache_get(tmdb_id, language)
+        if stored is not None:
+            details, fresh = stored
+            _cache_set(tmdb_id, {"runtime": details.get("runtime"), "details": details})
+            loaded += 1
+            if fresh:
+                continue
+        if not err:
+            _refresh_in_background(tmdb_id, headers, language, pool=_warm_pool)
+            queued += 1
+
+    return jsonify({"pid": os.getpid(), "loaded": loaded, "queued": queued, "stats": _tmdb_cache.stats()})
+
 @app.get("/api/movies")
 def api_movies():
-    rows = get_all_movies()
-    out = []
-    for m in rows:
-        out.append({
-            "id": m[0],
-            "title": m[1],
-            "format": m[2],
-            "year": m[3],
-            "poster_file": m[4],
-            "vote": m[5],
-            "added_at": m[6],
-            "watched": m[7],
-        })
-    return jsonify({"movies": out})
+    sort = request.args.get("sort", "title")
+    direction = request.args.get("dir", "asc")
+    watched = request.args.get("watched", "")
+    fmt = (request.args.get("format") or "").strip()
+    limit = request.args.get("limit", "")
+    cursor = request.args.get("cursor") or None
+
+    if sort not in SORT_KEYS or direction not in ("asc", "desc"):
+        return jsonify({"error": "Ogiltig sortering"}), 400
+    if watched not in ("", "0", "1") or (limit and not limit.isdigit()):
+        return jsonify({"error": "Ogiltig parameter"}), 400
+    limit = min(int(limit), GRID_PAGE) if limit and int(limit) > 0 else None
+
+    rev, updated_at = library_revision()
+    qs = hashlib.sha1(request.query_string).hexdigest()[:8]
+    etag = f"lib-r{rev}-{qs}"
+    resp = _not_modified(etag, updated_at)
+    if resp is not None:
+        return resp
+
+    try:
+        rows, next_cursor = query_movies(
+            sort, direction,
+            watched=int(watched) if watched else None,
+            fmt=fmt or None,
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    out = [_movie_json(m) for m in rows]
+    return _validators(jsonify({"movies": out, "next_cursor": next_cursor, "revision": rev}), etag, updated_at)
+
+@app.get("/api/movies/changes")
+def api_movie_changes():
+    since = request.args.get("since", "")
+    if not since.isdigit():
+        return jsonify({"error": "since saknas"}), 400
+    since = int(since)
+
+    with db() as conn:
+        # En läs-transaktion ger en konsistent bild av revision + ändringar
+        conn.execute("BEGIN")
+        rev, changes_since = conn.execute(
+            "SELECT revision, changes_since FROM library_meta WHERE id = 1"
+        ).fetchone()
+        if since < (changes_since or 0) or since > rev:
+            conn.rollback()
+            return jsonify({"revision": rev, "reset": True})
+
+        deleted = [r[0] for r in conn.execute(
+            "SELECT movie_id FROM movie_changes WHERE revision > ? AND deleted = 1", (since,)
+        )]
+        rows = conn.execute(
+            f"SELECT {', '.join('m.' + col for col in MOVIE_COLUMNS.split(', '))} "
+            "FROM movie_changes mc JOIN movies m ON m.id = mc.movie_id "
+            "WHERE mc.revision > ? AND mc.deleted = 0",
+            (since,)
+        ).fetchall()
+        conn.rollback()
+
+    return jsonify({
+        "revision": rev,
+        "upserts": [_movie_json(m) for m in rows],
+        "deleted": deleted,
+    })
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+def _highlight(text: str, terms) -> str:
+    """HTML-escapad text med <mark> runt alla förekomster av terms (foldade)."""
+    folded = fold(text)
+    spans = []
+    for t in terms:
+        i = folded.find(t)
+        while t and i >= 0:
+            spans.append((i, i + len(t)))
+            i = folded.find(t, i + 1)
+    spans.sort()
+    merged = []
+    for a, b in spans:
+        if merged and a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    out, pos = [], 0
+    for a, b in merged:
+        out.append(html.escape(text[pos:a]))
+        out.append("<mark>" + html.escape(text[a:b]) + "</mark>")
+        pos = b
+    out.append(html.escape(text[pos:]))
+    return "".join(out)
+
+SEARCH_LIMIT = 50
+
+@app.get("/api/search")
+def api_search():
+    q = fold((request.args.get("q") or "").strip())
+    words = [w for w in re.split(r"\s+", q) if w]
+    if not words:
+        return jsonify({"results": [], "mode": "empty"})
+
+    cols = "m.id, m.title, m.original_title, m.alt_titles"
+    with db() as conn:
+        if all(len(w) >= 3 for w in words):
+            # 1) Alla ord som delsträngar (trigram-index), rankat med bm25
+            mode, terms = "exact", words
+            rows = conn.execute(
+                f"SELECT {cols} FROM movies_fts f JOIN movies m ON m.id = f.rowid "
+                "WHERE movies_fts MATCH ? ORDER BY bm25(movies_fts, 10.0, 5.0, 3.0, 1.0) LIMIT ?",
+                (" AND ".join(_fts_phrase(w) for w in words), SEARCH_LIMIT)
+            ).fetchall()
+            if not rows:
+                # 2) Fuzzy: valfria trigram ur frågan, flest/bäst träffar först
+                mode = "fuzzy"
+                terms = sorted({w[i:i + 3] for w in words for i in range(len(w) - 2)})
+                rows = conn.execute(
+                    f"SELECT {cols} FROM movies_fts f JOIN movies m ON m.id = f.rowid "
+                    "WHERE movies_fts MATCH ? ORDER BY bm25(movies_fts, 10.0, 5.0, 3.0, 1.0) LIMIT ?",
+                    (" OR ".join(_fts_phrase(t) for t in terms), SEARCH_LIMIT)
+                ).fetchall()
+        else:
+            # Trigram kräver minst 3 tecken – korta frågor blir en LIKE över FTS-tabellen
+            mode, terms = "prefix", words
+            where = " AND ".join("(f.title LIKE ? OR f.original_title LIKE ? OR f.alt_titles LIKE ?)" for _ in words)
+            args = [a for w in words for a in (f"%{w}%",) * 3]
+            rows = conn.execute(
+                f"SELECT {cols} FROM movies_fts f JOIN movies m ON m.id = f.rowid "
+                f"WHERE {where} ORDER BY m.title COLLATE NOCASE LIMIT ?",
+                args + [SEARCH_LIMIT]
+            ).fetchall()
+
+    results = []
+    for movie_id, title, original_title, alt_titles in rows:
+        item = {"id": movie_id, "title": title, "highlight": _highlight(title or "", terms)}
+        # Visa vilken originaltitel/alternativ titel som matchade om inte titeln gjorde det
+        if "<mark>" not in item["highlight"]:
+            for other in [original_title or ""] + (alt_titles or "").split("\n"):
+                hl = _highlight(other, terms)
+                if "<mark>" in hl:
+                    item["matched"] = hl
+                    break
+        results.append(item)
+
+    return jsonify({"results": results, "mode": mode})
+
+# ===== Postervarianter =====
+# Vid inläggning skapas grid-, modal- och hög-DPI-storlek i AVIF (om Pillow
+# stödjer det), WebP och JPEG. /poster/<fil>?w=<bredd> väljer format via Accept.
+POSTER_WIDTHS = (200, 342, 600)  # grid, modal, hög DPI (samma lista i JS)
+POSTER_MAX_WIDTH = 780           # originalet sparas aldrig större än så
+POSTER_QUALITY = {"avif": 55, "webp": 80, "jpeg": 82}
+
+def _poster_formats():
+    if Image is None:
+        return ()
+    fmts = ["webp", "jpeg"]
+    try:
+        if features.check("avif"):
+            fmts.insert(0, "avif")
+    except Exception:
+        pass
+    return tuple(fmts)
+
+POSTER_FORMATS = _poster_formats()
+
+# Posters lagras innehållsadresserat: <sha256[:2]>/<sha256>.<ext>. Samma bild
+# sparas bara en gång och URL:en ändras när innehållet ändras -> immutable.
+POSTER_HASH_RE = re.compile(r"^[0-9a-f]{2}/([0-9a-f]{64})\.[a-z0-9]+$")
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+
+def _variant_path(poster_file: str, width: int, fmt: str) -> Path:
+    ext = "jpg" if fmt == "jpeg" else fmt
+    return POSTERS_DIR / "variants" / f"{poster_file}.{width}.{ext}"
+
+def _save_atomic(im, dest: Path, fmt: str, **kw):
+    # Egen temporärfil per skrivare: samtidiga förfrågningar efter samma variant
+    # får aldrig flytta in en halvskriven fil (den serveras som immutable)
+    fd, name = tempfile.mkstemp(prefix=f".{dest.name}.", suffix=".tmp", dir=dest.parent)
+    try:
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, "wb") as f:
+            im.save(f, fmt.upper(), **kw)
+        os.replace(name, dest)
+    except BaseException:
+        Path(name).unlink(missing_ok=True)
+        raise
+
+def _write_variants(im, poster_file: str, widths=POSTER_WIDTHS):
+    _variant_path(poster_file, 0, "jpeg").parent.mkdir(parents=True, exist_ok=True)
+    for w in widths:
+        v = im.copy()
+        v.thumbnail((min(w, im.width), im.height))  # aldrig uppskalning
+        for fmt in POSTER_FORMATS:
+            opts = {"quality": POSTER_QUALITY[fmt]}
+            if fmt == "jpeg":
+                opts.update(optimize=True, progressive=True)
+            _save_atomic(v, _variant_path(poster_file, w, fmt), fmt, **opts)
+
+def _open_poster(path: Path):
+    im = Image.open(path)
+    im = ImageOps.exif_transpose(im)
+    return im.convert("RGB")
+
+def _poster_color(im) -> str:
+    """Dominerande färg som #rrggbb – visas innan postern har laddats."""
+    small = im.copy()
+    small.thumbnail((32, 48))
+    q = small.quantize(colors=6)
+    _count, idx = max(q.getcolors())
+    r, g, b = q.getpalette()[idx * 3: idx * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def store_poster(src: Path, ext: str, refs: int = 1):
+    """Flyttar src in i posterlagret och tar refs referenser. Returnerar (poster_file, färg, bredd)."""
+    ext = ext.lower() if ext else ".jpg"
+    im = color = None
+    if Image is not None:
+        try:
+            im = _open_poster(src)
+            if im.width > POSTER_MAX_WIDTH:
+                # Stora original skalas ner innan de hashas
+                im.thumbnail((POSTER_MAX_WIDTH, im.height * POSTER_MAX_WIDTH // im.width + 1), Image.LANCZOS)
+                _save_atomic(im, src, "jpeg", quality=85, optimize=True, progressive=True)
+                ext = ".jpg"
+            color = _poster_color(im)
+        except (OSError, ValueError):
+            im = None  # trasig/okänd bild: originalet serveras som förut
+
+    digest = _file_sha256(src)
+    poster_file = f"{digest[:2]}/{digest}{ext}"
+    dest = POSTERS_DIR / poster_file
+
+    # BEGIN IMMEDIATE serialiserar mot release_poster: en fil som just fått en
+    # ny referens kan inte tas bort mellan kontrollen och flytten.
+    with db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT INTO poster_refs (file, refs) VALUES (?, ?) "
+            "ON CONFLICT(file) DO UPDATE SET refs = refs + excluded.refs",
+            (poster_file, refs)
+        )
+        created = not dest.exists()
+        if created:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(src, dest)
+        else:
+            src.unlink(missing_ok=True)  # dublett: behåll den som redan finns
+        conn.commit()
+
+    if created and im is not None:
+        try:
+            _write_variants(im, poster_file)
+        except (OSError, ValueError):
+            pass
+    return poster_file, color, (im.width if im is not None else None)
+
+def _unlink_poster(poster_file: str):
+    try:
+        (POSTERS_DIR / poster_file).unlink(missing_ok=True)
+        for w in POSTER_WIDTHS:
+            for fmt in ("avif", "webp", "jpeg"):
+                _variant_path(poster_file, w, fmt).unlink(missing_ok=True)
+    except Exception:
+        pass
+
+def release_poster(poster_file: str):
+    """Släpper en referens; filen (och varianterna) tas bort när ingen använder den."""
+    if not poster_file:
+        return
+    with db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT refs FROM poster_refs WHERE file = ?", (poster_file,)).fetchone()
+        if row and row[0] > 1:
+            conn.execute("UPDATE poster_refs SET refs = refs - 1 WHERE file = ?", (poster_file,))
+        else:
+            conn.execute("DELETE FROM poster_refs WHERE file = ?", (poster_file,))
+            _unlink_poster(poster_file)
+        conn.commit()
+
+def migrate_posters():
+    # Äldre platta filer (tmdb_<id>.jpg, manual_<ts>_<namn>) flyttas in i lagret
+    with db() as conn:
+        legacy = conn.execute(
+            "SELECT poster_file, COUNT(*) FROM movies "
+            "WHERE poster_file IS NOT NULL AND poster_file NOT LIKE '__/%' GROUP BY poster_file"
+        ).fetchall()
+    for old, n in legacy:
+        src = POSTERS_DIR / old
+        new = color = width = None
+        if safe_join(str(POSTERS_DIR), old) and src.is_file():
+            try:
+                new, color, width = store_poster(src, Path(old).suffix, refs=n)
+            except OSError:
+                continue
+        with db() as conn:
+            conn.execute(
+                "UPDATE movies SET poster_file = ?, poster_color = ?, poster_width = ? WHERE poster_file = ?",
+                (new, color, width, old)
+            )
+            conn.commit()
+        _unlink_poster(old)  # gamla varianter
+
+    # Platshållarfärg och bredd för posters som lades in innan kolumnerna fanns
+    if Image is None:
+        return
+    with db() as conn:
+        missing = [r[0] for r in conn.execute(
+            "SELECT DISTINCT poster_file FROM movies "
+            "WHERE poster_file IS NOT NULL AND (poster_color IS NULL OR poster_width IS NULL)"
+        )]
+    for poster_file in missing:
+        try:
+            im = _open_poster(POSTERS_DIR / poster_file)
+            color = _poster_color(im)
+        except (OSError, ValueError):
+            continue
+        with db() as conn:
+            conn.execute(
+                "UPDATE movies SET poster_color = ?, poster_width = ? WHERE poster_file = ?",
+                (color, im.width, poster_file)
+            )
+            conn.commit()
+
+# Nedladdning av TMDB-posters sker i bakgrunden; raden läggs in direkt med poster_pending
+_poster_pool = ThreadPoolExecutor(max_workers=POSTER_WORKERS, thread_name_prefix="poster")
+_queued_posters = set()  # rad-id med en nedladdning i kö eller på gång
+_queued_posters_lock = threading.Lock()
+
+def _download_poster(row_id: int, tmdb_id: int, poster_path: str):
+    try:
+        _download_poster_locked(row_id, tmdb_id, poster_path)
+    finally:
+        with _queued_posters_lock:
+            _queued_posters.discard(row_id)
+
+POSTER_ATTEMPTS = 3      # försök per körning; därefter nästa start (poster_pending ligger kvar)
+POSTER_RETRY_DELAY = 5   # sekunder, växer linjärt
+
+def _fetch_tmdb_poster(tmdb_id: int, poster_path: str):
+    """Hämtar postern (w780) in i lagret. (poster_file, färg, bredd), eller Nones om TMDB
+    svarar 404. Tillfälliga fel (nätverk, 5xx, disk) kastas så att anroparen kan försöka igen."""
+    POSTERS_DIR.mkdir(parents=True, exist_ok=True)
+    # behåll filändelsen (.jpg/.png) om den finns
+    ext = Path(urlparse(poster_path).path).suffix or ".jpg"
+    fd, name = tempfile.mkstemp(prefix=f".tmdb_{tmdb_id}.", suffix=".part", dir=POSTERS_DIR)
+    os.fchmod(fd, 0o644)  # mkstemp ger 0600; filen flyttas in i lagret som den är
+    os.close(fd)
+    tmp = Path(name)
+    try:
+        # TMDB image CDN – w780 räcker som källa för alla varianter
+        with tmdb.image("w780", poster_path, stream=True) as ir:
+            if ir.status_code == 404:
+                return None, None, None
+            if ir.status_code != 200:
+                raise requests.HTTPError(f"TMDB-bild {poster_path}: {ir.status_code}")
+            with open(tmp, "wb") as f:
+                for chunk in ir.iter_content(64 * 1024):
+                    f.write(chunk)
+        return store_poster(tmp, ext)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def _download_poster_locked(row_id: int, tmdb_id: int, poster_path: str):
+    for attempt in range(1, POSTER_ATTEMPTS + 1):
+        try:
+            poster_file, color, width = _fetch_tmdb_poster(tmdb_id, poster_path)
+            break
+        except (requests.RequestException, OSError):
+            # Raden behåller poster_pending och tas upp igen av resume_poster_downloads
+            if attempt == POSTER_ATTEMPTS or _shutting_down.wait(POSTER_RETRY_DELAY * attempt):
+                return
+
+    # Uppdateringen bumpar revisionen -> klienten hämtar ändringen. Den gäller
+    # bara om raden fortfarande väntar på just den här postern.
+    with db() as conn:
+        cur = conn.execute(
+            "UPDATE movies SET poster_file = ?, poster_color = ?, poster_width = ?, poster_pending = NULL "
+            "WHERE id = ? AND poster_pending = ?",
+            (poster_file, color, width, row_id, poster_path)
+        )
+        conn.commit()
+    if cur.rowcount == 0:
+        release_poster(poster_file)  # filmen togs bort eller fick en annan poster
+
+def queue_poster_download(row_id: int, tmdb_id: int, poster_path: str):
+    with _queued_posters_lock:
+        if row_id in _queued_posters:
+            return
+        _queued_posters.add(row_id)
+    try:
+        _poster_pool.submit(_download_poster, row_id, tmdb_id, poster_path)
+    except RuntimeError:
+        # poolen är nedstängd; raden ligger kvar med poster_pending
+        with _queued_posters_lock:
+            _queued_posters.discard(row_id)
+
+def resume_poster_downloads():
+    # Nedladdningar som inte hann klart före en omstart
+    with db() as conn:
+        rows = conn.execute(
+            "SELECT id, tmdb_id, poster_pending FROM movies WHERE poster_pending IS NOT NULL"
+        ).fetchall()
+    for row_id, tmdb_id, poster_path in rows:
+        queue_poster_download(row_id, tmdb_id, poster_path)
+
+def _negotiate_poster_format() -> str:
+    accept = request.headers.get("Accept", "")
+    for fmt in POSTER_FORMATS:
+        if fmt != "jpeg" and f"image/{fmt}" in accept:
+            return fmt
+    return "jpeg"
 
 @app.route("/poster/<path:filename>")
 def poster(filename: str):
-    posters_dir = "/config/movie_library/posters"  # str, inte Path
-    resp = send_from_directory(posters_dir, filename)
-    resp.headers["Cache-Control"] = "public, max-age=86400"
+    if not safe_join(str(POSTERS_DIR), filename):
+        return ("", 404)
+    m = POSTER_HASH_RE.match(filename)
+    path, etag, vary = POSTERS_DIR / filename, m and m.group(1), False
+
+    w = request.args.get("w", "")
+    if POSTER_FORMATS and w.isdigit() and int(w) in POSTER_WIDTHS:
+        fmt = _negotiate_poster_format()
+        vpath = _variant_path(filename, int(w), fmt)
+        if not vpath.exists() and path.is_file():
+            # Äldre posters: skapa varianten första gången den efterfrågas
+            try:
+                _write_variants(_open_poster(path), filename, widths=(int(w),))
+            except (OSError, ValueError):
+                pass
+        if vpath.exists():
+            path, vary = vpath, True
+            etag = etag and f"{etag}-{w}-{fmt}"
+
+    if not path.is_file():
+        return ("", 404)
+    if etag:
+        # Innehållsadresserad: stark ETag, 304 och Range sköts av send_file
+        resp = send_file(path, etag=etag, conditional=True, max_age=31536000)
+        resp.headers["Cache-Control"] = CACHE_IMMUTABLE
+    else:
+        resp = send_file(path, conditional=True)
+        resp.headers["Cache-Control"] = "public, max-age=86400"
+    if vary:
+        resp.headers["Vary"] = "Accept"
     return resp
 
-HTML = """
-<!doctype html>
-<html lang="sv">
-<head>
-  <meta charset="utf-8">
-  <meta name="viewport" content="width=device-width, initial-scale=1">
-  <title>Movie Library</title>
-  
-  <style>
+# ===== Statiska filer =====
+# CSS och JS ligger som egna konstanter och serveras från /assets/ med
+# innehållshash i namnet (se ASSETS), så webbläsaren kan cacha dem för alltid.
+APP_CSS = """
     body{
       font-family: system-ui, sans-serif;
       margin:16px;
@@ -215,6 +1165,8 @@ HTML = """
     
     .posterwrap { position: relative; }
     .posterwrap img { width: 100%; border-radius: 10px; display:block; }
+    /* Färgplatshållare (poster_color) syns tills bilden har laddats */
+    .grid .posterwrap img { aspect-ratio: 2/3; object-fit: cover; background: var(--ph, #0001); }
     .poster_placeholder { width:100%; aspect-ratio: 2/3; background:#0001; border-radius: 10px; }
     .rating{
       position:absolute;
@@ -461,6 +1413,25 @@ HTML = """
       font-weight: 700;
     }
     
+    /* Virtuell grid (JS): absolut placerade tiles med fast höjd */
+    .grid.vgrid{ display:block; position:relative; }
+    .grid.vgrid .tile{ position:absolute; box-sizing:border-box; }
+    .grid.vgrid .posterwrap img,
+    .grid.vgrid .poster_placeholder{ aspect-ratio: 2/3; object-fit: cover; }
+    .grid.vgrid .title{
+      height: 2.4em;
+      overflow: hidden;
+      display: -webkit-box;
+      -webkit-line-clamp: 2;
+      -webkit-box-orient: vertical;
+    }
+    .grid.vgrid .meta{ flex-wrap: nowrap; }
+    .grid.vgrid .badge{ white-space: nowrap; overflow: hidden; text-overflow: ellipsis; min-width: 0; }
+
+    /* Poster laddas ner i bakgrunden */
+    .tile[data-pending="1"] .poster_placeholder{ animation: pending 1.4s ease-in-out infinite; }
+    @keyframes pending{ 50%{ background: rgba(255,255,255,.08); } }
+
     .toast.show{ display:block; }
     
     .toast.ok{
@@ -478,244 +1449,186 @@ HTML = """
       color:#ff8b8b;
     }
     
-  </style>
-  
-</head>
-<body>
-  <h1>Movie Library</h1>
-  
-  <div class="topbar">
-    <div class="left">
-      <input id="lib_search" class="search" placeholder="Sök i samlingen…" autocomplete="off">
-    </div>
-  
-    <div class="right" style="display:flex; gap:10px; align-items:center;">
-      <button type="button" class="iconbtn" onclick="openAddModal()" aria-label="Lägg till film" title="Lägg till film">
-        +
-      </button>
-    </div>
-  </div>  
-  
-  <div id="search_hint" class="muted" style="margin-top:8px; display:none;"></div>
-  <div id="toast" class="toast" role="status" aria-live="polite"></div>
-  
+"""
 
-  {% if error %}
-    <div class="err">{{error}}</div>
-  {% endif %}
+# Sökindex för samlingen: laddas både som vanligt skript och som Web Worker
+SEARCH_JS = """
+// Sökindex för samlingen. Körs som Web Worker (se initSearchWorker) eller,
+// om workers inte går att starta, direkt på huvudtråden.
+function norm(s){
+  return (s || "")
+    .toString()
+    .toLowerCase()
+    .normalize("NFD").replace(/[\u0300-\u036f]/g, "") // åäö-hantering-ish
+    .trim();
+}
 
-  
+// Enkel fuzzy: matcha query som "subsequence" i text och ge score (båda normaliserade)
+function fuzzyScore(text, query){
+  if (!query) return 1;
 
-  <div id="addModal" class="modal" aria-hidden="true">
-    <div class="modal-backdrop" onclick="closeAddModal()"></div>
-  
-    <div class="modal-card" role="dialog" aria-modal="true" aria-label="Lägg till film">
-      <div class="modal-head">
-        <strong>Lägg till film</strong>
-        <button type="button" class="iconbtn small" onclick="closeAddModal()" aria-label="Stäng">×</button>
-      </div>
-  
-      <form method="post" action="add" onsubmit="return addMovie(this);">
+  let ti = 0;
+  let score = 0;
+  let streak = 0;
 
-        <!-- ================= TMDB-SEKTION ================= -->
-        <div class="section">
-          <div class="section-title">Sök på TMDB</div>
-        
-          <div class="tmdb-search-row">
-            <input id="tmdb_query"
-                   placeholder="Filmtitel…"
-                   autocomplete="off">
-        
-            <button type="button" onclick="tmdbSearch()">Sök</button>
-          </div>
-        
-          <div id="tmdb_results" class="results"></div>
-        </div>
-        
-        
-        <!-- ================= FORMAT (GEMENSAM) ================= -->
-        <div class="format-bar">
-          <div class="format-group">
-            <label class="chk">
-              <input type="checkbox" name="format" value="Blu-ray" checked>
-              Blu-ray
-            </label>
-        
-            <label class="chk">
-              <input type="checkbox" name="format" value="4K UHD">
-              4K UHD
-            </label>
-        
-            <label class="chk">
-              <input type="checkbox" name="format" value="DVD">
-              DVD
-            </label>
-          </div>
-        </div>
-        
-        
-        <!-- ================= MANUELL SEKTION ================= -->
-        <div class="section manual">
-          <div class="section-title">Manuell inläggning</div>
-        
-          <div class="row">
-            <input name="title" placeholder="Titel" required>
-            <input name="year" placeholder="År" type="number" min="1888" max="2100">
-          </div>
-          
-          <input type="file" name="poster_upload" accept="image/*">
-        
-          <input type="hidden" id="tmdb_id" name="tmdb_id">
-        
-          <button type="submit" class="primary-btn">
-            Lägg till manuellt
-          </button>
-        </div>
-        
-      
-      </form>
-      
-    </div>
-  </div>
-  
-  <div id="movieModal" class="modal" aria-hidden="true">
-    <div class="modal-backdrop" onclick="closeMovieModal()"></div>
-  
-    <div class="modal-card" role="dialog" aria-modal="true" aria-label="Filmdetaljer">
-      <div class="modal-head">
-        <strong id="mm_title">Film</strong>
-        <button type="button" class="iconbtn small" onclick="closeMovieModal()" aria-label="Stäng">×</button>
-      </div>
-  
-      <div style="display:flex; gap:14px; align-items:flex-start; flex-wrap:wrap;">
-        <div class="mm_postercol">
-          <img id="mm_poster" src="" alt="" style="width:100%; border-radius:12px; display:none;">
-          <div id="mm_poster_ph" class="poster_placeholder" style="display:block; width:100%;"></div>
-        </div>
-  
-        <div style="flex:1; min-width:240px;">
-          <div class="muted" id="mm_meta" style="margin-bottom:8px;"></div>
-          <div id="mm_overview" style="line-height:1.45;"></div>
-  
-          <div id="mm_genres" class="muted" style="margin-top:10px;"></div>
-          
-          <div style="margin-top:16px; display:flex; gap:12px; align-items:center; flex-wrap:wrap;">
-          
-            <label style="display:flex; align-items:center; gap:6px; font-weight:600;">
-              <input type="checkbox" id="mm_watched">
-              Markera som sett
-            </label>
-          
-            <button id="mm_delete"
-                    style="margin-left:auto; padding:6px 10px; font-size:13px; border-radius:8px;
-                           border:1px solid rgba(255,0,0,.3);
-                           background:#2a1215;
-                           color:#ff8b8b;
-                           cursor:pointer;">
-              Ta bort
-            </button>
-          
-          </div>
-        </div>
-      </div>
-    </div>
-  </div>
-
-  <div class="toolbar">
-    <label class="toolbar__label" for="sort_by">Sortera:</label>
-
-    <select id="sort_by" class="toolbar__select">
-      <option value="title">Namn</option>
-      <option value="year">År</option>
-      <option value="rating">Betyg</option>
-      <option value="added_at">Senast inlagd</option>
-    </select>
-
-    <button id="sort_dir" class="toolbar__button" type="button" title="Växla ordning">
-      A→Ö
-    </button>
-    
-    <label id="hide_watched_wrap" class="toolbar__check">
-      <input id="hide_watched" type="checkbox">
-      Dölj sedda
-    </label>
-    
-  </div>
-  
-  <div class="grid">
-    {% for m in movies %}
-      <div class="tile"
-           data-id="{{m[0]}}"
-           data-title="{{ (m[1] or '') }}"
-           data-year="{{ (m[3] or '') }}"
-           data-vote="{{ (m[5] if m[5] is not none else '') }}"
-           data-added="{{ (m[6] or '') }}"
-           data-watched="{{ m[7] }}"
-           data-format="{{ (m[2] or '')|lower }}">
-        <div class="posterwrap">
-          {% if m[4] %}
-            <img
-              src="poster/{{m[4]}}"
-              alt=""
-              loading="lazy"
-              decoding="async"
-              fetchpriority="low"
-            >
-          {% else %}
-            <div class="poster_placeholder"></div>
-          {% endif %}
-  
-          {% if m[5] is not none %}
-            <div class="rating">★ {{ "%.1f"|format(m[5]) }}</div>
-          {% endif %}
-        </div>
-  
-        <div class="title">{{m[1]}}</div>
-        <div class="meta">
-          <span class="badge">{{m[2]}}</span>
-          <span class="muted">{{m[3] or ""}}</span>
-        </div>
-               
-      </div>
-    {% endfor %}
-  </div>
-
-<script>
-async function tmdbSearch() {
-  const q = document.getElementById("tmdb_query").value.trim();
-  const box = document.getElementById("tmdb_results");
-  box.innerHTML = "";
-
-  if (!q) {
-    box.innerHTML = `<div class="muted">Skriv en titel först.</div>`;
-    return;
-  }
-
-  box.innerHTML = `<div class="muted">Söker…</div>`;
-
-  const res = await fetch(`tmdb/search_enriched?q=${encodeURIComponent(q)}`);
-  const data = await res.json().catch(() => ({}));
-
-  if (!res.ok) {
-    box.innerHTML = `<div class="err">${data.error || "TMDB-fel"}</div>`;
-    return;
-  }
-
-  const results = data.results || [];
-  if (results.length === 0) {
-    box.innerHTML = `<div class="muted">Inga träffar på TMDB.</div>`;
-    return;
-  }
-
-  box.innerHTML = results.map(r => `
-    <div class="card" style="display:flex; gap:12px; align-items:flex-start;">
-      ${r.poster ? `<img src="${r.poster}" style="width:70px; border-radius:6px;">` : `<div style="width:70px;"></div>`}
-      <div style="flex:1;">
-        <div style="display:flex; gap:10px; align-items:baseline; flex-wrap:wrap;">
-          <strong>${r.title}</strong>
-          <span class="muted">${r.year || ""}</span>
-          <span class="muted">⭐ ${r.vote ?? "-"}</span>
-          <span class="muted">${r.runtime ? `${r.runtime} min` : ""}</span>
+  for (let qi = 0; qi < query.length; qi++){
+    const qc = query[qi];
+    let found = false;
+    while (ti < text.length){
+      if (text[ti] === qc){
+        found = true;
+        streak += 1;
+        score += 10 * streak; // belöna sammanhängande träffar
+        ti += 1;
+        break;
+      } else {
+        streak = 0;
+        ti += 1;
+      }
+    }
+    if (!found) return 0;
+  }
+
+  return score;
+}
+
+function addPosting(map, key, i){
+  const list = map.get(key);
+  if (!list) map.set(key, [i]);
+  else if (list[list.length - 1] !== i) list.push(i);
+}
+
+// Normaliseras en gång per dataladdning: text, ordtabell och prefixtabell (1–3 tecken)
+function buildSearchIndex(docs){
+  const index = { docs: [], words: new Map(), prefixes: new Map() };
+
+  docs.forEach((d, i) => {
+    const text = norm(`${d.title || ""} ${d.year ?? ""} ${d.format || ""}`);
+    const words = Array.from(new Set(text.split(/\\s+/).filter(Boolean)));
+    index.docs.push({ id: String(d.id), text, words });
+
+    words.forEach(w => {
+      addPosting(index.words, w, i);
+      for (let n = 1; n <= Math.min(3, w.length); n++) addPosting(index.prefixes, w.slice(0, n), i);
+    });
+  });
+
+  return index;
+}
+
+function searchIndex(index, query){
+  const q = norm(query);
+  if (!q) return [];
+
+  const bonus = new Map();
+  const add = (i, n) => bonus.set(i, (bonus.get(i) || 0) + n);
+
+  // Bonus om query är prefix i något ord (kandidater ur prefixtabellen)
+  const cands = index.prefixes.get(q.slice(0, 3)) || [];
+  cands.forEach(i => {
+    if (q.length <= 3 || index.docs[i].words.some(w => w.startsWith(q))) add(i, 30);
+  });
+
+  // Bonus för hela ord i frågan
+  q.split(/\\s+/).forEach(w => (index.words.get(w) || []).forEach(i => add(i, 20)));
+
+  const hits = [];
+  index.docs.forEach((d, i) => {
+    const s = fuzzyScore(d.text, q);
+    if (s > 0) hits.push([d.id, s + (bonus.get(i) || 0)]);
+  });
+  hits.sort((a, b) => b[1] - a[1]);
+  return hits.map(h => h[0]);
+}
+
+if (typeof WorkerGlobalScope !== "undefined" && self instanceof WorkerGlobalScope){
+  let index = buildSearchIndex([]);
+  self.onmessage = (e) => {
+    const msg = e.data || {};
+    if (msg.type === "index") index = buildSearchIndex(msg.docs || []);
+    else if (msg.type === "search") self.postMessage({ seq: msg.seq, ids: searchIndex(index, msg.q) });
+  };
+}
+"""
+
+APP_JS = """
+// ===== TMDB-sök medan man skriver =====
+const TMDB_SEARCH_DEBOUNCE = 300; // ms efter senaste tangenttryckning
+const TMDB_SEARCH_MIN = 2;        // kortare frågor söks bara på Enter/knapp
+const TMDB_MEMO_MAX = 30;
+let _tmdbSearchTimer = null;
+let _tmdbSearchCtl = null;
+const _tmdbMemo = new Map();      // normaliserad fråga -> resultat (backsteg blir direkt)
+
+function queueTmdbSearch(){
+  clearTimeout(_tmdbSearchTimer);
+  _tmdbSearchTimer = setTimeout(() => tmdbSearch({ live: true }), TMDB_SEARCH_DEBOUNCE);
+}
+
+async function tmdbSearch(opts = {}) {
+  const live = !!opts.live;
+  clearTimeout(_tmdbSearchTimer);
+  const q = document.getElementById("tmdb_query").value.trim();
+  const box = document.getElementById("tmdb_results");
+
+  // En äldre fråga som fortfarande väntar på svar är inaktuell
+  if (_tmdbSearchCtl) _tmdbSearchCtl.abort();
+  _tmdbSearchCtl = null;
+
+  if (!q) {
+    box.innerHTML = live ? "" : `<div class="muted">Skriv en titel först.</div>`;
+    return;
+  }
+  if (live && q.length < TMDB_SEARCH_MIN) return;
+
+  const key = q.toLowerCase().replace(/\\s+/g, " ");
+  let results = _tmdbMemo.get(key);
+  if (!results) {
+    const ctl = _tmdbSearchCtl = new AbortController();
+    if (!live || !box.children.length) box.innerHTML = `<div class="muted">Söker…</div>`;
+
+    let res, data;
+    try {
+      res = await fetch(`tmdb/search_enriched?q=${encodeURIComponent(q)}${live ? "&live=1" : ""}`, { signal: ctl.signal });
+      data = await res.json().catch(() => ({}));
+    } catch (e) {
+      if (e.name === "AbortError") return;
+      box.innerHTML = `<div class="err">TMDB-fel</div>`;
+      return;
+    } finally {
+      if (_tmdbSearchCtl === ctl) _tmdbSearchCtl = null;
+    }
+    // Avbruten under läsningen av svaret: json-felet ovan sväljs, så det får
+    // inte sparas eller ritas som en tom träfflista
+    if (ctl.signal.aborted) return;
+
+    if (!res.ok) {
+      box.innerHTML = `<div class="err">${data.error || "TMDB-fel"}</div>`;
+      return;
+    }
+
+    results = data.results || [];
+    // Live-svar kan sakna speltid (kort väntan); de sparas inte
+    if (!live || results.every(r => r.runtime != null)) {
+      _tmdbMemo.set(key, results);
+      if (_tmdbMemo.size > TMDB_MEMO_MAX) _tmdbMemo.delete(_tmdbMemo.keys().next().value);
+    }
+  }
+
+  if (results.length === 0) {
+    box.innerHTML = `<div class="muted">Inga träffar på TMDB.</div>`;
+    return;
+  }
+
+  box.innerHTML = results.map(r => `
+    <div class="card" style="display:flex; gap:12px; align-items:flex-start;">
+      ${r.poster ? `<img src="${r.poster}" style="width:70px; border-radius:6px;">` : `<div style="width:70px;"></div>`}
+      <div style="flex:1;">
+        <div style="display:flex; gap:10px; align-items:baseline; flex-wrap:wrap;">
+          <strong>${r.title}</strong>
+          <span class="muted">${r.year || ""}</span>
+          <span class="muted">⭐ ${r.vote ?? "-"}</span>
+          <span class="muted">${r.runtime ? `${r.runtime} min` : ""}</span>
         </div>
         ${r.overview ? `<div style="margin-top:6px;">${r.overview.substring(0, 200)}${r.overview.length>200?"…":""}</div>` : ""}
         <div style="margin-top:8px;">
@@ -796,7 +1709,20 @@ document.addEventListener("DOMContentLoaded", () => {
   });
 });
 
+// TMDB-id som håller på att läggas till (dubbelklick skickar bara en begäran)
+const _addingTmdb = new Set();
+
 async function addFromTmdb(id) {
+  if (_addingTmdb.has(id)) return;
+  _addingTmdb.add(id);
+  try {
+    await addFromTmdbOnce(id);
+  } finally {
+    _addingTmdb.delete(id);
+  }
+}
+
+async function addFromTmdbOnce(id) {
 
   // Hämta markerade checkbox-format
   const checked = Array.from(
@@ -838,91 +1764,102 @@ function wireEnterToSearch() {
       tmdbSearch();
     }
   });
+  title.addEventListener("input", queueTmdbSearch);
 }
 document.addEventListener("DOMContentLoaded", wireEnterToSearch);
 
-function norm(s){
-  return (s || "")
-    .toString()
-    .toLowerCase()
-    .normalize("NFD").replace(/[\u0300-\u036f]/g, "") // åäö-hantering-ish
-    .trim();
-}
+let _searchTimer = null;
+let _searchSeq = 0;
+let _searchIds = null;  // rankade id:n (strängar) när sök i samlingen är aktiv
 
-// Enkel fuzzy: matcha query som "subsequence" i text och ge score
-function fuzzyScore(text, query){
-  text = norm(text);
-  query = norm(query);
-  if (!query) return 1;
+function filterLibrary(){
+  updateHideWatchedVisibility();
+  const q = document.getElementById("lib_search").value;
 
-  let ti = 0;
-  let score = 0;
-  let streak = 0;
+  if (_searchTimer) clearTimeout(_searchTimer);
 
-  for (let qi = 0; qi < query.length; qi++){
-    const qc = query[qi];
-    let found = false;
-    while (ti < text.length){
-      if (text[ti] === qc){
-        found = true;
-        streak += 1;
-        score += 10 * streak; // belöna sammanhängande träffar
-        ti += 1;
-        break;
-      } else {
-        streak = 0;
-        ti += 1;
-      }
-    }
-    if (!found) return 0;
+  if (!q.trim()){
+    _searchSeq += 1;  // ignorera svar på tidigare sökningar
+    _searchIds = null;
+    updateView();
+    return;
   }
 
-  // Bonus om query är prefix i något ord
-  if (text.split(/\s+/).some(w => w.startsWith(query))) score += 30;
-
-  return score;
+  _searchTimer = setTimeout(() => runSearch(q), 120);
 }
 
-function filterLibrary(){
-  updateHideWatchedVisibility();
-  const q = document.getElementById("lib_search").value;
-  const tiles = Array.from(document.querySelectorAll(".grid .tile"));
-  const hint = document.getElementById("search_hint");
+// ===== Sökindex i Web Worker =====
+let _searchWorker = null;
+let _localIndex = null;         // används bara om workern inte kan startas
+const _searchPending = new Map(); // seq -> resolve
 
-  if (!q.trim()){
-    tiles.forEach(t => { t.style.display = ""; t.style.order = ""; });
-    hint.style.display = "none";
-    applyHideWatched();
-    return;
+function initSearchWorker(){
+  try{
+    // Samma cachade fil som sidan laddar, nu som worker
+    _searchWorker = new Worker(document.getElementById("search_index_js").src);
+    _searchWorker.onmessage = (e) => {
+      const done = _searchPending.get(e.data.seq);
+      if (!done) return;
+      _searchPending.delete(e.data.seq);
+      done(e.data.ids);
+    };
+    _searchWorker.onerror = () => {
+      // Fortsätt på huvudtråden; svara på väntande sökningar därifrån
+      _searchWorker = null;
+      _searchPending.forEach((done) => done([]));
+      _searchPending.clear();
+    };
+  } catch(e){
+    _searchWorker = null;
   }
-  
-  if (typeof applyHideWatched === "function") applyHideWatched();
+}
+
+// Anropas när _movies har laddats om eller ändrats
+function loadSearchIndex(){
+  _localIndex = null;
+  if (!_searchWorker) return;
+  const docs = _movies.map(m => ({ id: m.id, title: m.title, year: m.year, format: m.format }));
+  _searchWorker.postMessage({ type: "index", docs });
+}
 
-  let shown = 0;
+function searchIds(q, seq){
+  if (_searchWorker){
+    return new Promise(resolve => {
+      _searchPending.set(seq, resolve);
+      _searchWorker.postMessage({ type: "search", seq, q });
+    });
+  }
+  if (!_localIndex) _localIndex = buildSearchIndex(_movies);
+  return Promise.resolve(searchIndex(_localIndex, q));
+}
 
-  tiles.forEach(t => {
-    const title = t.dataset.title || "";
-    const year = t.dataset.year || "";
-    const fmt  = t.dataset.format || "";
+// Lokalt index först (direkt), sedan kompletteras med serverns FTS
+// som även täcker original- och alternativtitlar (/api/search)
+async function runSearch(q){
+  const seq = ++_searchSeq;
 
-    const hay = `${title} ${year} ${fmt}`;
-    const s = fuzzyScore(hay, q);
+  const local = await searchIds(q, seq);
+  if (seq !== _searchSeq) return;  // en nyare sökning har startat
+  applySearchRanking(local);
 
-    if (s > 0){
-      t.style.display = "";
-      // sortera “bäst match” först via flex/grid order
-      t.style.order = String(1000000 - s);
-      shown += 1;
-    } else {
-      t.style.display = "none";
-      t.style.order = "";
+  let remote = null;
+  try{
+    const res = await fetch(`api/search?q=${encodeURIComponent(q)}`);
+    if (res.ok){
+      const data = await res.json();
+      remote = (data.results || []).map(r => String(r.id));
     }
-  });
+  } catch(e){ /* lokala träffar räcker */ }
 
-  hint.style.display = "";
-  hint.textContent = `${shown} träff${shown===1?"":"ar"} i samlingen`;
-  
-  applyHideWatched();
+  if (seq !== _searchSeq || !remote) return;
+  const seen = new Set(local);
+  const extra = remote.filter(id => !seen.has(id));
+  if (extra.length) applySearchRanking(local.concat(extra));
+}
+
+function applySearchRanking(ids){
+  _searchIds = ids;
+  updateView();
 }
 
 function updateHideWatchedVisibility(){
@@ -1027,64 +1964,172 @@ function escapeHtml(s){
     .replaceAll("'","&#39;");
 }
 
-function tileHtml(m){
-  const id = m.id;
-  const title = m.title || "";
-  const year = m.year ?? "";
-  const fmt = (m.format || "");
-  const fmtLower = fmt.toLowerCase();
-  const vote = (m.vote === null || m.vote === undefined) ? null : Number(m.vote);
-  const poster = m.poster_file ? `poster/${encodeURIComponent(m.poster_file)}` : "";
+// Postervarianter (samma bredder som POSTER_WIDTHS i app.py)
+const POSTER_WIDTHS = [200, 342, 600];
+const GRID_POSTER_SIZES = "(max-width: 520px) 45vw, 200px";
+
+// Varianter skalas aldrig upp: bredare än originalet är samma bild igen,
+// så srcset anger varje variants verkliga bredd och hoppar över dubbletter
+function posterSrcset(base, width){
+  const seen = new Set();
+  return POSTER_WIDTHS
+    .map(w => [w, width ? Math.min(w, width) : w])
+    .filter(([, real]) => !seen.has(real) && seen.add(real))
+    .map(([w, real]) => `${base}?w=${w} ${real}w`).join(", ");
+}
+
+// En tile-nod som återanvänds av den virtuella griden (fylls via fillTile)
+function makeTile(){
+  const t = document.createElement("div");
+  t.className = "tile";
+  t.innerHTML = `
+    <div class="posterwrap">
+      <img alt="" decoding="async" sizes="${GRID_POSTER_SIZES}">
+      <div class="poster_placeholder"></div>
+      <div class="rating"></div>
+    </div>
+    <div class="title"></div>
+    <div class="meta">
+      <span class="badge"></span>
+      <span class="muted"></span>
+    </div>`;
+  return t;
+}
+
+function fillTile(t, m){
+  const vote = (m.vote === null || m.vote === undefined || m.vote === "") ? null : Number(m.vote);
   const watched = (m.watched === 1 || m.watched === "1") ? "1" : "0";
 
-  // Obs: data-title sparas original, vi normaliserar vid sort/filter i JS
-  return `
-    <div class="tile"
-         data-id="${id}"
-         data-title="${escapeHtml(title)}"
-         data-year="${escapeHtml(year)}"
-         data-vote="${vote == null ? "" : vote}"
-         data-added="${escapeHtml(m.added_at || "")}"
-         data-watched="${watched}"
-         data-format="${escapeHtml(fmtLower)}">
-      <div class="posterwrap">
-        ${poster
-          ? `<img src="${poster}" alt="" loading="lazy" decoding="async" fetchpriority="low">`
-          : `<div class="poster placeholder"></div>`
-        }
-        ${vote != null ? `<div class="rating">★ ${vote.toFixed(1)}</div>` : ``}
-      </div>
+  t.dataset.id = m.id;
+  t.dataset.watched = watched;
+  t.dataset.pending = m.poster_pending ? "1" : "0";
+
+  const img = t.querySelector("img");
+  const ph = t.querySelector(".poster_placeholder");
+  const wrap = t.querySelector(".posterwrap");
+  if (m.poster_color) wrap.style.setProperty("--ph", m.poster_color);
+  else wrap.style.removeProperty("--ph");
+  const poster = m.poster_file ? `poster/${m.poster_file.split("/").map(encodeURIComponent).join("/")}` : "";
+  if (poster){
+    if (img.dataset.base !== poster){
+      img.dataset.base = poster;
+      img.srcset = posterSrcset(poster, m.poster_width);
+      img.src = `${poster}?w=${POSTER_WIDTHS[0]}`;
+    }
+    img.style.display = "";
+    ph.style.display = "none";
+  } else {
+    img.removeAttribute("src");
+    img.removeAttribute("srcset");
+    delete img.dataset.base;
+    img.style.display = "none";
+    ph.style.display = "";
+  }
 
-      <div class="title">${escapeHtml(title)}</div>
-      <div class="meta">
-        <span class="badge">${escapeHtml(fmt)}</span>
-        <span class="muted">${escapeHtml(year)}</span>
-      </div>
+  const rating = t.querySelector(".rating");
+  rating.textContent = vote != null ? `★ ${vote.toFixed(1)}` : "";
+  rating.style.display = vote != null ? "" : "none";
 
-    </div>
-  `;
+  t.querySelector(".title").textContent = m.title || "";
+  t.querySelector(".badge").textContent = m.format || "";
+  t.querySelector(".meta .muted").textContent = m.year ?? "";
+}
+
+// Senast kända biblioteksrevision (från api-svaren)
+let _libRevision = null;
+
+// Biblioteket hämtas som data i sidor (keyset-cursor, samma storlek som
+// GRID_PAGE i app.py – första sidan är förladdad av <link rel=preload>)
+const GRID_PAGE = 500;
+let _fullLoad = null;
+
+function loadFullGrid(progressive = false){
+  if (!_fullLoad) _fullLoad = fetchAllMovies(progressive).finally(() => { _fullLoad = null; });
+  return _fullLoad;
+}
+
+async function fetchAllMovies(progressive){
+  const movies = [];
+  let cursor = null, first = null, last = null;
+  do {
+    const qs = `limit=${GRID_PAGE}` + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : "");
+    const res = await fetch(`api/movies?${qs}`);
+    if (!res.ok) return false;
+    const data = await res.json();
+    movies.push(...(data.movies || []));
+    if (first == null) first = data.revision ?? null;
+    last = data.revision ?? null;
+    cursor = data.next_cursor;
+    if (progressive){
+      // Första laddningen: rita varje sida direkt i stället för att vänta på allt
+      _movies = movies;
+      updateView();
+    }
+  } while (cursor);
+
+  // Ändringar under hämtningen kommer via ändringsflödet från första sidans revision
+  _movies = movies;
+  _libRevision = first;
+  if (last === first || !(await applyLibraryChanges())) loadSearchIndex();
+  return true;
+}
+
+// Hämtar bara ändrade rader sedan _libRevision. false = gör full omladdning.
+async function applyLibraryChanges(){
+  if (_libRevision == null) return false;
+
+  const res = await fetch(`api/movies/changes?since=${_libRevision}`);
+  if (!res.ok) return false;
+
+  const data = await res.json().catch(() => null);
+  if (!data || data.reset) return false;
+
+  const gone = new Set((data.deleted || []).map(String));
+  const upserts = new Map((data.upserts || []).map(m => [String(m.id), m]));
+
+  _movies = _movies
+    .filter(m => !gone.has(String(m.id)))
+    .map(m => {
+      const u = upserts.get(String(m.id));
+      if (u) upserts.delete(String(m.id));
+      return u || m;
+    })
+    .concat(Array.from(upserts.values()));
+
+  _libRevision = data.revision;
+  loadSearchIndex();
+  return true;
 }
 
 async function refreshLibraryGrid(){
-  const curGrid = document.querySelector(".grid");
-  if (!curGrid) return;
+  if (!document.querySelector(".grid")) return;
 
-  const res = await fetch("api/movies", { cache: "no-store" });
-  if (!res.ok) return;
+  const applied = await applyLibraryChanges();
+  if (!applied) await loadFullGrid();
 
-  const data = await res.json();
-  const movies = Array.isArray(data.movies) ? data.movies : [];
+  // Sök i samlingen körs om (rankningen kan ha ändrats), annars ritas vyn om
+  filterLibrary();
 
-  // Bygg HTML i minnet och byt i ett svep
-  curGrid.innerHTML = movies.map(m => tileHtml(m)).join("");
+  schedulePosterPoll();
+}
 
-  // Re-wire tile klick (öppna modal) + behåll din filter/sort om du vill
-  wireTileClicks();
+// Så länge någon poster laddas ner i bakgrunden: fråga efter ändringar med jämna mellanrum
+let _posterPollTimer = null;
+let _posterPolls = 0;
 
-  // Om du använder filterLibrary() (sök i samlingen): applicera igen
-  if (typeof filterLibrary === "function") filterLibrary();
-  
-  applyHideWatched();
+function schedulePosterPoll(){
+  if (_posterPollTimer) return;
+  if (!_movies.some(m => m.poster_pending)){
+    _posterPolls = 0;
+    return;
+  }
+  if (_posterPolls >= 30) return;  // ge upp efter ~1 min
+
+  _posterPolls += 1;
+  _posterPollTimer = setTimeout(async () => {
+    _posterPollTimer = null;
+    await refreshLibraryGrid();
+  }, 2000);
 }
 
 function openMovieModal(){
@@ -1118,7 +2163,7 @@ async function showMovieDetails(movieRowId){
   img.style.display = "none";
   ph.style.display = "block";
 
-  const res = await fetch(`movie/${movieRowId}`, { cache: "no-store" });
+  const res = await fetch(`movie/${movieRowId}`);
   const data = await res.json().catch(() => ({}));
   if (!res.ok){
     document.getElementById("mm_title").textContent = "Kunde inte ladda";
@@ -1147,60 +2192,166 @@ async function showMovieDetails(movieRowId){
   }
 
   if (data.poster_local){
-    img.src = data.poster_local;
+    img.sizes = "(max-width: 520px) 90vw, 300px";
+    img.srcset = posterSrcset(data.poster_local, data.poster_width);
+    img.src = `${data.poster_local}?w=${POSTER_WIDTHS[1]}`;
     img.onload = () => { ph.style.display = "none"; img.style.display = "block"; };
     img.onerror = () => { img.style.display = "none"; ph.style.display = "block"; };
   }
 }
 
-function wireTileClicks(){
-  document.querySelectorAll(".grid .tile").forEach(tile => {
-    tile.addEventListener("click", (e) => {
-      if (e.target && e.target.closest && e.target.closest("form")) return;
+// ===== Virtuell grid: alla filmer i _movies, bara synliga rader i DOM =====
+const VGRID_MIN_COL = 140;  // samma som minmax(140px, 1fr)
+const VGRID_GAP = 14;
+const VGRID_OVERSCAN = 3;   // extra rader ovanför/under skärmen
 
-      const id = tile.dataset.id;
-      if (id) showMovieDetails(id);
-    });
-  });
+let _movies = [];  // alla filmer (samma form som api/movies)
+let _view = [];    // sorterat + filtrerat urval som visas
+const _vg = { cols: 1, tileW: 0, rowH: 0, nodes: new Map(), free: [], raf: 0 };
+
+function isWatched(m){
+  return m.watched === 1 || m.watched === "1";
 }
 
-function applyHideWatched(){
-  const cb = document.getElementById("hide_watched");
-  if (!cb) return;
+function updateView(){
+  if (_searchIds){
+    // Sök vinner över sortering och "Dölj sedda"
+    const byId = new Map(_movies.map(m => [String(m.id), m]));
+    _view = _searchIds.map(id => byId.get(id)).filter(Boolean);
 
-  // Om sök är aktiv: "Dölj sedda" ska inte gälla
-  const q = (document.getElementById("lib_search")?.value || "").trim();
-  if (q) return;
+    const hint = document.getElementById("search_hint");
+    hint.style.display = "";
+    hint.textContent = `${_view.length} träff${_view.length===1?"":"ar"} i samlingen`;
+  } else {
+    const hide = document.getElementById("hide_watched")?.checked;
+    _view = hide ? _movies.filter(m => !isWatched(m)) : _movies.slice();
+    if (typeof window.sortMovies === "function") window.sortMovies(_view);
+
+    document.getElementById("search_hint").style.display = "none";
+  }
+  layoutGrid();
+  renderWindow(true);
+}
 
-  const hide = cb.checked;
+function layoutGrid(){
+  const grid = document.querySelector(".grid");
+  if (!grid || !grid.classList.contains("vgrid")) return;
+
+  const w = grid.clientWidth;
+  const cols = Math.max(1, Math.floor((w + VGRID_GAP) / (VGRID_MIN_COL + VGRID_GAP)));
+  const tileW = (w - VGRID_GAP * (cols - 1)) / cols;
+  if (cols !== _vg.cols || tileW !== _vg.tileW){
+    _vg.cols = cols;
+    _vg.tileW = tileW;
+    _vg.rowH = 0;
+  }
+  if (!_vg.rowH) _vg.rowH = measureRowHeight(grid);
 
-  document.querySelectorAll(".grid .tile").forEach(tile => {
-    const watched = tile.dataset.watched === "1";
-    tile.style.display = (hide && watched) ? "none" : "";
-  });
+  const rows = Math.ceil(_view.length / cols);
+  grid.style.height = rows ? `${rows * _vg.rowH - VGRID_GAP}px` : "0px";
 }
 
-document.addEventListener("DOMContentLoaded", wireTileClicks);
+function measureRowHeight(grid){
+  // Alla tiles har samma höjd (poster 2:3 + två titelrader), mät en
+  const probe = makeTile();
+  fillTile(probe, { id: 0, title: "Xg", format: "DVD", year: 2000, vote: 5, watched: 0 });
+  probe.style.width = `${_vg.tileW}px`;
+  probe.style.visibility = "hidden";
+  grid.appendChild(probe);
+  const h = probe.offsetHeight;
+  probe.remove();
+  return h + VGRID_GAP;
+}
 
-document.addEventListener("keydown", (e) => {
-  if (e.key === "Escape"){
-    const add = document.getElementById("addModal");
-    const mov = document.getElementById("movieModal");
+function renderWindow(force){
+  _vg.raf = 0;
+  const grid = document.querySelector(".grid");
+  if (!grid || !_vg.rowH) return;
+
+  // Synligt område relativt gridens topp
+  const top = -grid.getBoundingClientRect().top;
+  const firstRow = Math.max(0, Math.floor(top / _vg.rowH) - VGRID_OVERSCAN);
+  const lastRow = Math.ceil((top + window.innerHeight) / _vg.rowH) + VGRID_OVERSCAN;
+  const first = firstRow * _vg.cols;
+  const last = Math.min(_view.length, lastRow * _vg.cols);
+
+  // Noder som lämnat fönstret (eller allt vid force) återanvänds
+  for (const [i, node] of _vg.nodes){
+    if (force || i < first || i >= last){
+      _vg.nodes.delete(i);
+      _vg.free.push(node);
+    }
+  }
 
-    if (add && add.classList.contains("open")) closeAddModal();
-    if (mov && mov.classList.contains("open")) closeMovieModal();
+  for (let i = first; i < last; i++){
+    if (_vg.nodes.has(i)) continue;
+    const node = _vg.free.pop() || grid.appendChild(makeTile());
+    fillTile(node, _view[i]);
+    node.style.display = "";
+    node.style.width = `${_vg.tileW}px`;
+    node.style.left = `${(i % _vg.cols) * (_vg.tileW + VGRID_GAP)}px`;
+    node.style.top = `${Math.floor(i / _vg.cols) * _vg.rowH}px`;
+    _vg.nodes.set(i, node);
   }
-});
 
-(function(){
-  const collatorSV = new Intl.Collator("sv", { sensitivity: "base" });
+  _vg.free.forEach(n => { n.style.display = "none"; });
+}
 
-  function getSortState() {
-    return {
-      by: localStorage.getItem("ml_sort_by") || "title",
-      dir: localStorage.getItem("ml_sort_dir") || "asc",
-    };
-  }
+function scheduleRender(){
+  if (!_vg.raf) _vg.raf = requestAnimationFrame(() => renderWindow(false));
+}
+
+function initVirtualGrid(){
+  const grid = document.querySelector(".grid");
+  if (!grid) return;
+
+  grid.classList.add("vgrid");
+  initSearchWorker();
+
+  grid.addEventListener("click", (e) => {
+    const tile = e.target.closest && e.target.closest(".tile");
+    if (tile && tile.dataset.id) showMovieDetails(tile.dataset.id);
+  });
+
+  window.addEventListener("scroll", scheduleRender, { passive: true });
+  window.addEventListener("resize", () => {
+    layoutGrid();
+    renderWindow(true);
+  });
+
+  updateView();
+  loadFullGrid(true).then(() => {
+    filterLibrary();  // en sökning som skrevs under laddningen körs mot hela biblioteket
+    schedulePosterPoll();
+  });
+}
+
+function applyHideWatched(){
+  // Om sök är aktiv: "Dölj sedda" gäller inte (updateView hanterar det)
+  updateView();
+}
+
+document.addEventListener("DOMContentLoaded", initVirtualGrid);
+
+document.addEventListener("keydown", (e) => {
+  if (e.key === "Escape"){
+    const add = document.getElementById("addModal");
+    const mov = document.getElementById("movieModal");
+
+    if (add && add.classList.contains("open")) closeAddModal();
+    if (mov && mov.classList.contains("open")) closeMovieModal();
+  }
+});
+
+(function(){
+  const collatorSV = new Intl.Collator("sv", { sensitivity: "base" });
+
+  function getSortState() {
+    return {
+      by: localStorage.getItem("ml_sort_by") || "title",
+      dir: localStorage.getItem("ml_sort_dir") || "asc",
+    };
+  }
 
   function setSortState(by, dir) {
     localStorage.setItem("ml_sort_by", by);
@@ -1212,6 +2363,7 @@ document.addEventListener("keydown", (e) => {
   }
 
   function num(v, fallback){
+    if (v === null || v === undefined || v === "") return fallback;
     const n = Number(v);
     return Number.isFinite(n) ? n : fallback;
   }
@@ -1234,48 +2386,26 @@ document.addEventListener("keydown", (e) => {
         : (dir === "asc" ? "↑" : "↓");
   }
 
-  function sortGridTiles(){
+  // Sorterar listan på plats (anropas från updateView)
+  window.sortMovies = function(list){
     const { by, dir } = getSortState();
     const sign = dir === "desc" ? -1 : 1;
 
-    const tiles = Array.from(document.querySelectorAll(".grid .tile"));
-
-    // Om användaren söker i samlingen: låt sök-rankning vinna (din filterLibrary använder order för matchscore)
-    const q = (document.getElementById("lib_search")?.value || "").trim();
-    if (q) {
-      updateSortUI(by, dir);
-      return;
-    }
-
-    const ranked = tiles.map((t) => {
-      const title = normTitle(t.dataset.title);
-      const year  = num(t.dataset.year, 0);
-      const vote  = (t.dataset.vote === "" || t.dataset.vote == null) ? null : num(t.dataset.vote, 0);
-      const added = timeMs(t.dataset.added);
-
-      // primary key
-      let key;
-      if (by === "title") key = title;
-      else if (by === "year") key = year;
-      else if (by === "rating") key = (vote == null ? -1 : vote);
-      else if (by === "added_at") key = added;
-      else key = title;
-
-      return { t, title, year, vote, added, key };
-    });
+    const ranked = list.map((m) => ({
+      m,
+      title: normTitle(m.title),
+      year: num(m.year, 0),
+      vote: num(m.vote, -1),
+      added: timeMs(m.added_at),
+    }));
 
     ranked.sort((a, b) => {
       let diff = 0;
 
-      if (by === "title") {
-        diff = collatorSV.compare(a.title, b.title);
-      } else if (by === "year") {
-        diff = (a.year - b.year);
-      } else if (by === "rating") {
-        diff = ((a.vote == null ? -1 : a.vote) - (b.vote == null ? -1 : b.vote));
-      } else if (by === "added_at") {
-        diff = (a.added - b.added);
-      }
+      if (by === "year") diff = (a.year - b.year);
+      else if (by === "rating") diff = (a.vote - b.vote);
+      else if (by === "added_at") diff = (a.added - b.added);
+      else diff = collatorSV.compare(a.title, b.title);
 
       // sekundärsort: alltid titel
       if (diff === 0) diff = collatorSV.compare(a.title, b.title);
@@ -1283,12 +2413,12 @@ document.addEventListener("keydown", (e) => {
       return diff * sign;
     });
 
-    // Applicera ordning via CSS order (funkar fint med CSS grid)
-    ranked.forEach((x, i) => {
-      x.t.style.order = String(i);
-    });
-
+    ranked.forEach((x, i) => { list[i] = x.m; });
     updateSortUI(by, dir);
+  };
+
+  function sortGridTiles(){
+    updateView();
   }
 
   function initSort(){
@@ -1308,7 +2438,8 @@ document.addEventListener("keydown", (e) => {
       sortGridTiles();
     });
 
-    sortGridTiles();
+    const { by, dir } = getSortState();
+    updateSortUI(by, dir);
   }
 
   document.addEventListener("DOMContentLoaded", initSort);
@@ -1326,24 +2457,239 @@ document.addEventListener("keydown", (e) => {
   
     applyHideWatched();
   });
-
-  // Kör om sort efter att du uppdaterat griden (refreshLibraryGrid)
-  const _oldRefresh = window.refreshLibraryGrid;
-  if (typeof _oldRefresh === "function") {
-    window.refreshLibraryGrid = async function(){
-      await _oldRefresh();
-      sortGridTiles();
-    };
-  }
 })();
 
-</script>
+"""
+
+HTML = """
+<!doctype html>
+<html lang="sv">
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <title>Movie Library</title>
+  
+  <link rel="stylesheet" href="{{ assets['app.css'] }}">
+  <link rel="preload" href="api/movies?limit={{ grid_page }}" as="fetch" crossorigin>
+  
+</head>
+<body>
+  <h1>Movie Library</h1>
+  
+  <div class="topbar">
+    <div class="left">
+      <input id="lib_search" class="search" placeholder="Sök i samlingen…" autocomplete="off">
+    </div>
+  
+    <div class="right" style="display:flex; gap:10px; align-items:center;">
+      <button type="button" class="iconbtn" onclick="openAddModal()" aria-label="Lägg till film" title="Lägg till film">
+        +
+      </button>
+    </div>
+  </div>  
+  
+  <div id="search_hint" class="muted" style="margin-top:8px; display:none;"></div>
+  <div id="toast" class="toast" role="status" aria-live="polite"></div>
+  
+
+  {% if error %}
+    <div class="err">{{error}}</div>
+  {% endif %}
+
+  
+
+  <div id="addModal" class="modal" aria-hidden="true">
+    <div class="modal-backdrop" onclick="closeAddModal()"></div>
+  
+    <div class="modal-card" role="dialog" aria-modal="true" aria-label="Lägg till film">
+      <div class="modal-head">
+        <strong>Lägg till film</strong>
+        <button type="button" class="iconbtn small" onclick="closeAddModal()" aria-label="Stäng">×</button>
+      </div>
+  
+      <form method="post" action="add" onsubmit="return addMovie(this);">
+
+        <!-- ================= TMDB-SEKTION ================= -->
+        <div class="section">
+          <div class="section-title">Sök på TMDB</div>
+        
+          <div class="tmdb-search-row">
+            <input id="tmdb_query"
+                   placeholder="Filmtitel…"
+                   autocomplete="off">
+        
+            <button type="button" onclick="tmdbSearch()">Sök</button>
+          </div>
+        
+          <div id="tmdb_results" class="results"></div>
+        </div>
+        
+        
+        <!-- ================= FORMAT (GEMENSAM) ================= -->
+        <div class="format-bar">
+          <div class="format-group">
+            <label class="chk">
+              <input type="checkbox" name="format" value="Blu-ray" checked>
+              Blu-ray
+            </label>
+        
+            <label class="chk">
+              <input type="checkbox" name="format" value="4K UHD">
+              4K UHD
+            </label>
+        
+            <label class="chk">
+              <input type="checkbox" name="format" value="DVD">
+              DVD
+            </label>
+          </div>
+        </div>
+        
+        
+        <!-- ================= MANUELL SEKTION ================= -->
+        <div class="section manual">
+          <div class="section-title">Manuell inläggning</div>
+        
+          <div class="row">
+            <input name="title" placeholder="Titel" required>
+            <input name="year" placeholder="År" type="number" min="1888" max="2100">
+          </div>
+          
+          <input type="file" name="poster_upload" accept="image/*">
+        
+          <input type="hidden" id="tmdb_id" name="tmdb_id">
+        
+          <button type="submit" class="primary-btn">
+            Lägg till manuellt
+          </button>
+        </div>
+        
+      
+      </form>
+      
+    </div>
+  </div>
+  
+  <div id="movieModal" class="modal" aria-hidden="true">
+    <div class="modal-backdrop" onclick="closeMovieModal()"></div>
+  
+    <div class="modal-card" role="dialog" aria-modal="true" aria-label="Filmdetaljer">
+      <div class="modal-head">
+        <strong id="mm_title">Film</strong>
+        <button type="button" class="iconbtn small" onclick="closeMovieModal()" aria-label="Stäng">×</button>
+      </div>
+  
+      <div style="display:flex; gap:14px; align-items:flex-start; flex-wrap:wrap;">
+        <div class="mm_postercol">
+          <img id="mm_poster" src="" alt="" style="width:100%; border-radius:12px; display:none;">
+          <div id="mm_poster_ph" class="poster_placeholder" style="display:block; width:100%;"></div>
+        </div>
+  
+        <div style="flex:1; min-width:240px;">
+          <div class="muted" id="mm_meta" style="margin-bottom:8px;"></div>
+          <div id="mm_overview" style="line-height:1.45;"></div>
+  
+          <div id="mm_genres" class="muted" style="margin-top:10px;"></div>
+          
+          <div style="margin-top:16px; display:flex; gap:12px; align-items:center; flex-wrap:wrap;">
+          
+            <label style="display:flex; align-items:center; gap:6px; font-weight:600;">
+              <input type="checkbox" id="mm_watched">
+              Markera som sett
+            </label>
+          
+            <button id="mm_delete"
+                    style="margin-left:auto; padding:6px 10px; font-size:13px; border-radius:8px;
+                           border:1px solid rgba(255,0,0,.3);
+                           background:#2a1215;
+                           color:#ff8b8b;
+                           cursor:pointer;">
+              Ta bort
+            </button>
+          
+          </div>
+        </div>
+      </div>
+    </div>
+  </div>
+
+  <div class="toolbar">
+    <label class="toolbar__label" for="sort_by">Sortera:</label>
+
+    <select id="sort_by" class="toolbar__select">
+      <option value="title">Namn</option>
+      <option value="year">År</option>
+      <option value="rating">Betyg</option>
+      <option value="added_at">Senast inlagd</option>
+    </select>
+
+    <button id="sort_dir" class="toolbar__button" type="button" title="Växla ordning">
+      A→Ö
+    </button>
+    
+    <label id="hide_watched_wrap" class="toolbar__check">
+      <input id="hide_watched" type="checkbox">
+      Dölj sedda
+    </label>
+    
+  </div>
+  
+  <!-- Griden ritas av app.js från api/movies (virtuell, bara synliga rader i DOM) -->
+  <div class="grid"></div>
+
+<script id="search_index_js" src="{{ assets['search.js'] }}"></script>
+
+<script src="{{ assets['app.js'] }}"></script>
 </body>
 </html>
 """
 
+@dataclass(frozen=True)
+class Asset:
+    mimetype: str
+    etag: str
+    bodies: dict  # kodning ("identity", "gzip", "br") -> bytes
+
+def _build_assets():
+    """Namn med innehållshash -> Asset, med förkomprimerade varianter."""
+    assets, urls = {}, {}
+    for name, mimetype, text in (
+        ("app.css", "text/css", APP_CSS),
+        ("search.js", "text/javascript", SEARCH_JS),
+        ("app.js", "text/javascript", APP_JS),
+    ):
+        body = text.encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        stem, ext = name.rsplit(".", 1)
+        hashed = f"{stem}.{digest}.{ext}"
+        bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            bodies["br"] = brotli.compress(body, quality=11)
+        assets[hashed] = Asset(mimetype, digest, bodies)
+        urls[name] = f"assets/{hashed}"  # relativ, fungerar bakom ingress
+    return assets, urls
+
+ASSETS, ASSET_URLS = _build_assets()
+
+@app.route("/assets/<name>")
+def asset(name: str):
+    a = ASSETS.get(name)
+    if a is None:
+        return ("", 404)
+    encoding = _accepted_encoding() or "identity"
+    if request.if_none_match.contains_weak(a.etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = Response(a.bodies[encoding], mimetype=a.mimetype)
+        if encoding != "identity":
+            resp.headers["Content-Encoding"] = encoding
+    resp.set_etag(a.etag, weak=encoding != "identity")
+    resp.headers["Cache-Control"] = CACHE_IMMUTABLE
+    resp.vary.add("Accept-Encoding")
+    return resp
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = _open_db()
     c = conn.cursor()
     
     # Skapa tabell om den inte finns (ny installation)
@@ -1376,6 +2722,119 @@ def init_db():
     cols = [row[1] for row in c.fetchall()]
     if "tmdb_id" not in cols:
         c.execute("ALTER TABLE movies ADD COLUMN tmdb_id INTEGER")
+    if "original_title" not in cols:
+        c.execute("ALTER TABLE movies ADD COLUMN original_title TEXT")
+    if "alt_titles" not in cols:
+        c.execute("ALTER TABLE movies ADD COLUMN alt_titles TEXT")  # radbrytningsseparerade
+    if "poster_pending" not in cols:
+        c.execute("ALTER TABLE movies ADD COLUMN poster_pending TEXT")  # TMDB poster_path som laddas ner
+    if "poster_color" not in cols:
+        c.execute("ALTER TABLE movies ADD COLUMN poster_color TEXT")  # platshållare, #rrggbb
+    if "poster_width" not in cols:
+        c.execute("ALTER TABLE movies ADD COLUMN poster_width INTEGER")  # originalets bredd (px)
+    # Foldad söktext (se _fold_pending); meta_fold IS NULL = behöver foldas
+    for col in ("title_fold", "original_title_fold", "alt_titles_fold", "meta_fold"):
+        if col not in cols:
+            c.execute(f"ALTER TABLE movies ADD COLUMN {col} TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_movies_unfolded ON movies(id) WHERE meta_fold IS NULL")
+
+    # Fulltextsök (trigram) över *_fold-kolumnerna – hålls i synk med triggers.
+    # Triggarna använder bara inbyggd SQL så att andra skrivare (sqlite3-CLI, en
+    # äldre version av tillägget) inte fallerar; deras rader blir osökbara tills
+    # _fold_pending har körts.
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'movies_fts'")
+    fts_new = c.fetchone() is None
+    c.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+            title, original_title, alt_titles, meta, tokenize = 'trigram'
+        )
+    """)
+    fts_row = "{0}.title_fold, {0}.original_title_fold, {0}.alt_titles_fold, {0}.meta_fold"
+    for name in ("insert", "update"):
+        c.execute(f"DROP TRIGGER IF EXISTS trg_movies_fts_{name}")  # äldre versioner anropade fold()
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_movies_fts_insert AFTER INSERT ON movies
+        BEGIN
+            INSERT INTO movies_fts (rowid, title, original_title, alt_titles, meta)
+            VALUES (NEW.id, {fts_row.format("NEW")});
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_movies_fts_update
+        AFTER UPDATE OF title_fold, original_title_fold, alt_titles_fold, meta_fold ON movies
+        BEGIN
+            DELETE FROM movies_fts WHERE rowid = OLD.id;
+            INSERT INTO movies_fts (rowid, title, original_title, alt_titles, meta)
+            VALUES (NEW.id, {fts_row.format("NEW")});
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_movies_fold_stale
+        AFTER UPDATE OF title, original_title, alt_titles, year, format ON movies
+        BEGIN
+            UPDATE movies SET meta_fold = NULL WHERE id = NEW.id;
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_movies_fts_delete AFTER DELETE ON movies
+        BEGIN
+            DELETE FROM movies_fts WHERE rowid = OLD.id;
+        END
+    """)
+    if fts_new:
+        c.execute(f"INSERT INTO movies_fts (rowid, title, original_title, alt_titles, meta) SELECT id, {fts_row.format('movies')} FROM movies")
+
+    # Referensräkning för innehållsadresserade posters (se store_poster)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS poster_refs (
+            file TEXT PRIMARY KEY,
+            refs INTEGER NOT NULL
+        )
+    """)
+
+    # Bulkimport: jobb och rader (se _run_import)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            source TEXT NOT NULL,
+            fmt TEXT,
+            watched INTEGER,
+            status TEXT NOT NULL,
+            parsed INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at REAL,
+            updated_at REAL
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS import_rows (
+            job_id INTEGER NOT NULL,
+            line INTEGER NOT NULL,
+            title TEXT,
+            year INTEGER,
+            fmt TEXT,
+            watched INTEGER,
+            imdb_id TEXT,
+            tmdb_id INTEGER,
+            status TEXT NOT NULL,
+            candidates TEXT,
+            PRIMARY KEY (job_id, line)
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_import_rows_status ON import_rows(job_id, status)")
+
+    # Persistent TMDB-cache (se _pcache_get)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS tmdb_cache (
+            tmdb_id INTEGER NOT NULL,
+            language TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (tmdb_id, language)
+        )
+    """)
 
     # Unikhet på tmdb_id (hindrar dubletter från TMDB)
     c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_movies_tmdb_id ON movies(tmdb_id)")
@@ -1383,65 +2842,323 @@ def init_db():
     # (Valfritt men bra) Unikhet för manuella inlägg: title+year+format
     c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_movies_title_year_format ON movies(title, year, format)")
 
+    # Biblioteksrevision: bumpas av triggers i samma transaktion som varje skrivning
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS library_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            revision INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    """)
+    c.execute("INSERT OR IGNORE INTO library_meta (id, revision, updated_at) VALUES (1, 0, strftime('%s','now'))")
+
+    # Ändringslogg för /api/movies/changes: senaste ändringen per film (kompakt)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS movie_changes (
+            movie_id INTEGER PRIMARY KEY,
+            revision INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_movie_changes_revision ON movie_changes(revision)")
+    c.execute("PRAGMA table_info(library_meta)")
+    if "changes_since" not in [row[1] for row in c.fetchall()]:
+        # Loggen täcker bara ändringar efter denna revision
+        c.execute("ALTER TABLE library_meta ADD COLUMN changes_since INTEGER")
+        c.execute("UPDATE library_meta SET changes_since = revision WHERE id = 1")
+
+    for op in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(f"DROP TRIGGER IF EXISTS trg_movies_rev_{op.lower()}")
+        ref, deleted = ("OLD", 1) if op == "DELETE" else ("NEW", 0)
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_movies_change_{op.lower()} AFTER {op} ON movies
+            BEGIN
+                UPDATE library_meta SET revision = revision + 1, updated_at = strftime('%s','now') WHERE id = 1;
+                INSERT OR REPLACE INTO movie_changes (movie_id, revision, deleted)
+                VALUES ({ref}.id, (SELECT revision FROM library_meta WHERE id = 1), {deleted});
+            END
+        """)
+
+    # Ett index per sorteringsordning i /api/movies (samma uttryck som i SORT_KEYS)
+    for name, expr in SORT_KEYS.items():
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_movies_sort_{name} ON movies({expr}, id)")
+
+    _fold_pending(conn)  # befintliga rader och rader från andra skrivare
     conn.commit()
     conn.close()
 
+def _fold_pending(conn):
+    """Skriver foldad söktext för nya/ändrade rader; körs före commit i varje skrivning."""
+    rows = conn.execute(
+        "SELECT id, title, original_title, alt_titles, year, format FROM movies WHERE meta_fold IS NULL"
+    ).fetchall()
+    conn.executemany(
+        "UPDATE movies SET title_fold = ?, original_title_fold = ?, alt_titles_fold = ?, meta_fold = ? WHERE id = ?",
+        [(fold(title), fold(original_title), fold(alt_titles), fold(f"{'' if year is None else year} {fmt or ''}"), movie_id)
+         for movie_id, title, original_title, alt_titles, year, fmt in rows]
+    )
+
+
+# Sorteringsnycklar för /api/movies; NULL mappas till ett värde så keyset-jämförelser fungerar
+SORT_KEYS = {
+    "title": "title COLLATE NOCASE",
+    "year": "IFNULL(year, -1)",
+    "rating": "IFNULL(vote, -1)",
+    "added_at": "IFNULL(added_at, '')",
+}
+MOVIE_COLUMNS = (
+    "id, title, format, year, poster_file, vote, added_at, watched, poster_pending IS NOT NULL, poster_color, "
+    "poster_width"
+)
+
+def _encode_cursor(key, movie_id) -> str:
+    raw = json.dumps([key, movie_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key, movie_id = json.loads(raw)
+        if isinstance(key, (str, int, float)) and isinstance(movie_id, int):
+            return key, movie_id
+    except (ValueError, TypeError):
+        pass
+    raise ValueError("Ogiltig cursor")
+
+def query_movies(sort="title", direction="asc", watched=None, fmt=None, limit=None, cursor=None):
+    """Sorterad/filtrerad sida ur movies. Returnerar (rows, next_cursor)."""
+    key = SORT_KEYS[sort]
+    desc = direction == "desc"
+    where, args = [], []
+
+    if watched is not None:
+        where.append("watched = ?")
+        args.append(watched)
+    if fmt:
+        where.append("format LIKE ?")
+        args.append(f"%{fmt}%")
+    if cursor:
+        # (key, id) efter cursorn, skrivet så att indexet kan användas för sökning
+        last_key, last_id = _decode_cursor(cursor)
+        op = "<" if desc else ">"
+        where.append(f"{key} {op}= ? AND ({key} {op} ? OR id {op} ?)")
+        args += [last_key, last_key, last_id]
+
+    sql = f"SELECT {MOVIE_COLUMNS}, {key} FROM movies"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    order = "DESC" if desc else "ASC"
+    sql += f" ORDER BY {key} {order}, id {order}"
+    if limit:
+        sql += " LIMIT ?"
+        args.append(limit + 1)  # en extra rad avgör om det finns en nästa sida
+
+    with db() as conn:
+        rows = conn.execute(sql, args).fetchall()
+
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1][-1], rows[-1][0])
+    return [r[:-1] for r in rows], next_cursor
+
+def library_revision():
+    """(revision, updated_at) – ändras vid varje skrivning mot movies."""
+    with db() as conn:
+        row = conn.execute("SELECT revision, updated_at FROM library_meta WHERE id = 1").fetchone()
+    return row if row else (0, 0)
+
+# Mallen ingår i ETag för "/" så att en uppgradering inte ger gammal HTML
+_HTML_TAG = hashlib.sha1((HTML + "".join(ASSET_URLS.values())).encode("utf-8")).hexdigest()[:8]
+
+# Mallen kompileras en gång vid start
+_page_tpl = app.jinja_env.from_string(HTML)
+
+# Sidstorlek när klienten hämtar biblioteket (samma som GRID_PAGE i app.js och
+# högsta limit i /api/movies)
+GRID_PAGE = 500
+
+def render_home(error=None, **prefill) -> str:
+    return _page_tpl.render(error=error, assets=ASSET_URLS, grid_page=GRID_PAGE, **prefill)
+
+def _not_modified(etag: str, last_modified: int = None):
+    """304-svar om klientens kopia fortfarande gäller, annars None."""
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)  # komprimerade svar har svag ETag
+    else:
+        ims = request.if_modified_since
+        fresh = bool(ims and last_modified and ims.timestamp() >= last_modified)
+    if not fresh:
+        return None
+    resp = app.response_class(status=304)
+    return _validators(resp, etag, last_modified)
+
+def _validators(resp, etag: str, last_modified: int = None):
+    resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = "no-cache"  # cacha, men validera alltid
+    return resp
+
+# ===== Komprimering =====
+# Textsvar komprimeras med brotli (om modulen finns) eller gzip enligt
+# Accept-Encoding. Svar med ETag (sidan, biblioteket) komprimeras en gång per
+# version och kodning; strömmade svar komprimeras bit för bit.
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_TYPES = frozenset({
+    "text/html", "text/css", "text/javascript", "application/javascript",
+    "application/json", "text/csv", "application/x-ndjson",
+})
+COMPRESS_CACHE_BYTES = 4 * 1024 * 1024
+
+_compressed = OrderedDict()  # (etag, kodning) -> bytes
+_compressed_size = 0
+_compressed_lock = threading.Lock()
+
+def _accepted_encoding():
+    if brotli is not None and request.accept_encodings["br"]:
+        return "br"
+    if request.accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+def _compress(data: bytes, encoding: str, ahead: bool = False) -> bytes:
+    # Förkomprimerat återanvänds, så där lönar sig en högre nivå
+    if encoding == "br":
+        return brotli.compress(data, quality=9 if ahead else 5)
+    return gzip.compress(data, compresslevel=9 if ahead else 6, mtime=0)
+
+def _compress_cached(etag: str, data: bytes, encoding: str) -> bytes:
+    global _compressed_size
+    key = (etag, encoding)
+    with _compressed_lock:
+        out = _compressed.get(key)
+        if out is not None:
+            _compressed.move_to_end(key)
+            return out
+    out = _compress(data, encoding, ahead=True)
+    with _compressed_lock:
+        if key not in _compressed:
+            _compressed[key] = out
+            _compressed_size += len(out)
+            while _compressed_size > COMPRESS_CACHE_BYTES and len(_compressed) > 1:
+                _old, dropped = _compressed.popitem(last=False)
+                _compressed_size -= len(dropped)
+    return out
+
+def _compress_stream(body, encoding: str):
+    # Sync-flush efter varje bit: webbläsaren kan rendera medan resten strömmar
+    try:
+        if encoding == "br":
+            c = brotli.Compressor(quality=4)
+            for chunk in body:
+                out = c.process(chunk.encode("utf-8") if isinstance(chunk, str) else chunk) + c.flush()
+                if out:
+                    yield out
+            yield c.finish()
+        else:
+            c = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = gzip-ramverk
+            for chunk in body:
+                yield c.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk) + c.flush(zlib.Z_SYNC_FLUSH)
+            yield c.flush()
+    finally:
+        close = getattr(body, "close", None)
+        if close:
+            close()
+
+@app.after_request
+def compress_response(resp):
+    if resp.status_code == 304:
+        # Samma (svaga) validator som det komprimerade svaret klienten har
+        etag, _weak = resp.get_etag()
+        if etag and _accepted_encoding():
+            resp.set_etag(etag, weak=True)
+            resp.vary.add("Accept-Encoding")
+        return resp
+    if (resp.mimetype not in COMPRESS_TYPES or resp.direct_passthrough
+            or resp.status_code < 200 or resp.status_code == 204
+            or "Content-Encoding" in resp.headers or "Content-Range" in resp.headers):
+        return resp
+
+    resp.vary.add("Accept-Encoding")
+    encoding = _accepted_encoding()
+    if encoding is None:
+        return resp
+
+    etag, _weak = resp.get_etag()
+    if resp.is_streamed:
+        resp.response = _compress_stream(resp.response, encoding)
+        resp.headers.pop("Content-Length", None)
+    else:
+        data = resp.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return resp
+        resp.set_data(_compress_cached(etag, data, encoding) if etag else _compress(data, encoding))
+    resp.headers["Content-Encoding"] = encoding
+    if etag:
+        resp.set_etag(etag, weak=True)  # samma innehåll, annan byte-representation
+    return resp
+
+def _movie_json(m):
+    return {
+        "id": m[0],
+        "title": m[1],
+        "format": m[2],
+        "year": m[3],
+        "poster_file": m[4],
+        "vote": m[5],
+        "added_at": m[6],
+        "watched": m[7],
+        "poster_pending": m[8],
+        "poster_color": m[9],
+        "poster_width": m[10],
+    }
 
 def get_all_movies():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, title, format, year, poster_file, vote, added_at, watched FROM movies ORDER BY title COLLATE NOCASE")
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    with db() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT {MOVIE_COLUMNS} FROM movies ORDER BY title COLLATE NOCASE")
+        return c.fetchall()
 
 @app.post("/toggle_watched/<int:movie_id>")
 def toggle_watched(movie_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    c.execute("UPDATE movies SET watched = CASE watched WHEN 1 THEN 0 ELSE 1 END WHERE id = ?", (movie_id,))
-    conn.commit()
-    conn.close()
+    with db() as conn:
+        c = conn.cursor()
+        c.execute("UPDATE movies SET watched = CASE watched WHEN 1 THEN 0 ELSE 1 END WHERE id = ?", (movie_id,))
+        conn.commit()
 
     return jsonify({"status": "ok"})
 
 @app.route("/delete/<int:movie_id>", methods=["POST"])
 def delete_movie(movie_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    with db() as conn:
+        c = conn.cursor()
 
-    # Hämta ev posterfil för att kunna ta bort lokalt
-    c.execute("SELECT poster_file FROM movies WHERE id=?", (movie_id,))
-    row = c.fetchone()
+        # Hämta ev posterfil för att kunna ta bort lokalt
+        c.execute("SELECT poster_file FROM movies WHERE id=?", (movie_id,))
+        row = c.fetchone()
 
-    c.execute("DELETE FROM movies WHERE id=?", (movie_id,))
-    conn.commit()
-    conn.close()
+        c.execute("DELETE FROM movies WHERE id=?", (movie_id,))
+        deleted = c.rowcount
+        conn.commit()
 
-    # Ta bort posterfil om den finns
-    if row and row[0]:
-        try:
-            posters_dir = Path("/config/movie_library/posters")
-            f = posters_dir / row[0]
-            if f.exists():
-                f.unlink()
-        except Exception:
-            pass
+    # Släpp referensen; filen tas bort först när ingen annan film använder den
+    if deleted and row and row[0]:
+        release_poster(row[0])
 
     return ("", 204)
 
 
 @app.route("/")
 def home():
-    return render_template_string(
-        HTML,
-        movies=get_all_movies(),
-        error=None,
-        prefill_title=None,
-        prefill_year=None,
-        prefill_format="Blu-ray"
-    )
+    # Sidan innehåller inga filmer längre; den ändras bara med mallen och tillgångarna
+    etag = f"home-{_HTML_TAG}"
+    resp = _not_modified(etag)
+    if resp is not None:
+        return resp
+
+    prefill = {"prefill_title": None, "prefill_year": None, "prefill_format": "Blu-ray"}
+    return _validators(Response(render_home(error=None, **prefill), mimetype="text/html"), etag)
 
 @app.route("/add", methods=["POST"])
 def add():
@@ -1455,67 +3172,58 @@ def add():
     tmdb_val = int(tmdb_id) if tmdb_id.isdigit() else None
     
     # ===== Manuell poster-upload =====
-    poster_file = None
+    poster_file = poster_color = poster_width = None
     f = request.files.get("poster_upload")
     if f and f.filename:
-        posters_dir = Path("/config/movie_library/posters")
-        posters_dir.mkdir(parents=True, exist_ok=True)
+        POSTERS_DIR.mkdir(parents=True, exist_ok=True)
 
         safe = secure_filename(f.filename)
         ext = Path(safe).suffix.lower()
 
         if ext not in [".jpg", ".jpeg", ".png", ".webp"]:
-            return render_template_string(
-                HTML,
-                movies=get_all_movies(),
+            return render_home(
                 error="Endast .jpg/.jpeg/.png/.webp stöds för poster.",
                 prefill_title=title,
                 prefill_year=year_val,
                 prefill_format=fmt
             )
 
-        poster_file = f"manual_{int(time())}_{safe}"
-        dest = posters_dir / poster_file
-        f.save(dest)
-
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+        tmp = POSTERS_DIR / f".manual_{int(time())}_{safe}.part"
+        try:
+            f.save(tmp)
+            poster_file, poster_color, poster_width = store_poster(tmp, ext)
+        finally:
+            tmp.unlink(missing_ok=True)
 
     try:
-        # Om tmdb_id finns: den är unik via index -> stoppar dublett
-        if tmdb_val is not None:
-            c.execute(
-                "INSERT INTO movies (title, format, year, tmdb_id, poster_file, added_at) VALUES (?, ?, ?, ?, ?, datetime('now'))",
-                (title, fmt, year_val, tmdb_val, poster_file)
-            )
-        else:
-            # Manuell: stoppa dublett via title+year+format-index
-            c.execute(
-                "INSERT INTO movies (title, format, year, tmdb_id, poster_file, added_at) VALUES (?, ?, ?, NULL, ?, datetime('now'))",
-                (title, fmt, year_val, poster_file)
-            )
-
-        conn.commit()
+        with db() as conn:
+            c = conn.cursor()
+            # Om tmdb_id finns: den är unik via index -> stoppar dublett
+            if tmdb_val is not None:
+                c.execute(
+                    "INSERT INTO movies (title, format, year, tmdb_id, poster_file, poster_color, poster_width, added_at) VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))",
+                    (title, fmt, year_val, tmdb_val, poster_file, poster_color, poster_width)
+                )
+            else:
+                # Manuell: stoppa dublett via title+year+format-index
+                c.execute(
+                    "INSERT INTO movies (title, format, year, tmdb_id, poster_file, poster_color, poster_width, added_at) VALUES (?, ?, ?, NULL, ?, ?, ?, datetime('now'))",
+                    (title, fmt, year_val, poster_file, poster_color, poster_width)
+                )
+
+            _fold_pending(conn)
+            conn.commit()
     except sqlite3.IntegrityError:
-        conn.close()
+        # Om vi hann spara en fil: släpp referensen vid dublett
+        release_poster(poster_file)
     
-        # Om vi hann spara en fil: städa bort vid dublett
-        if poster_file:
-            try:
-                (Path("/config/movie_library/posters") / poster_file).unlink(missing_ok=True)
-            except Exception:
-                pass
-    
-        return render_template_string(
-            HTML,
-            movies=get_all_movies(),
+        return render_home(
             error="Dublett: filmen finns redan i samlingen.",
             prefill_title=title,
             prefill_year=year_val,
             prefill_format=fmt
         )
 
-    conn.close()
     return ("", 204)
 
 @app.route("/tmdb/add/<int:movie_id>", methods=["POST"])
@@ -1524,14 +3232,36 @@ def tmdb_add(movie_id: int):
     if err:
         return jsonify({"error": err}), 400
 
-    url = f"https://api.themoviedb.org/3/movie/{movie_id}"
-    params = {"language": tmdb_language()}
-    r = requests.get(url, headers=headers, params=params, timeout=10)
-    if r.status_code != 200:
-        return jsonify({"error": f"TMDB-detaljer misslyckades ({r.status_code})"}), 502
+    # Tillägg av samma film körs i tur och ordning; ett dubbelklick väntar här
+    # och ser sedan raden som redan finns, utan ett nytt TMDB-anrop
+    with _add_locks.hold(movie_id):
+        with db() as conn:
+            exists = conn.execute("SELECT 1 FROM movies WHERE tmdb_id = ?", (movie_id,)).fetchone()
+        if exists:
+            return jsonify({"status": "duplicate"}), 200
+        return _tmdb_add_locked(movie_id, headers)
+
+def _alt_titles(j: dict, title: str, original_title: str):
+    """Radbrytningsseparerade alternativa titlar ur append_to_response=alternative_titles.
+
+    "" betyder att TMDB har svarat utan några (NULL = inte hämtat än)."""
+    if "alternative_titles" not in j:
+        return None
+    alt = []
+    for t in (j["alternative_titles"] or {}).get("titles") or []:
+        name = (t.get("title") or "").strip()
+        if name and name not in alt and name not in (title, original_title):
+            alt.append(name)
+    return "\n".join(alt)
+
+def _tmdb_add_locked(movie_id: int, headers: dict):
+    status, j = _tmdb_movie(movie_id, headers, tmdb_language(), append="alternative_titles")
+    if status != 200:
+        return jsonify({"error": f"TMDB-detaljer misslyckades ({status})"}), 502
 
-    j = r.json()
     title = (j.get("title") or "").strip()
+    original_title = (j.get("original_title") or "").strip() or None
+    alt_titles = _alt_titles(j, title, original_title)
     date = j.get("release_date") or ""
     year = int(date.split("-")[0]) if date and date[:4].isdigit() else None
 
@@ -1540,38 +3270,23 @@ def tmdb_add(movie_id: int):
     vote = j.get("vote_average")  # float
     poster_path = j.get("poster_path")  # t.ex. "/abc123.jpg"
     
-    poster_file = None
-    if poster_path:
-        posters_dir = Path("/config/movie_library/posters")
-        posters_dir.mkdir(parents=True, exist_ok=True)
-    
-        # behåll filändelsen (.jpg/.png) om den finns
-        ext = Path(urlparse(poster_path).path).suffix or ".jpg"
-        poster_file = f"tmdb_{movie_id}{ext}"
-        dest = posters_dir / poster_file
-    
-        # TMDB image CDN
-        img_url = f"https://image.tmdb.org/t/p/w185{poster_path}"
-        ir = requests.get(img_url, timeout=15)
-        if ir.status_code == 200:
-            dest.write_bytes(ir.content)
-        else:
-            poster_file = None
-
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
     try:
-        c.execute(
-            "INSERT INTO movies (title, format, year, tmdb_id, poster_file, vote, added_at) VALUES (?, ?, ?, ?, ?, ?, datetime('now'))",
-            (title, fmt, year, movie_id, poster_file, vote)
-        )
-        conn.commit()
+        with db() as conn:
+            cur = conn.execute(
+                "INSERT INTO movies (title, format, year, tmdb_id, vote, original_title, alt_titles, poster_pending, added_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))",
+                (title, fmt, year, movie_id, vote, original_title, alt_titles, poster_path or None)
+            )
+            _fold_pending(conn)
+            conn.commit()
+            row_id = cur.lastrowid
     except sqlite3.IntegrityError:
-        conn.close()
         return jsonify({"status": "duplicate"}), 200
 
-    conn.close()
-    return jsonify({"status": "added"}), 200
+    # Postern laddas ner i bakgrunden; griden plockar upp den via ändringsflödet
+    if poster_path:
+        queue_poster_download(row_id, movie_id, poster_path)
+
+    return jsonify({"status": "added", "poster_pending": bool(poster_path)}), 200
 
 @app.route("/tmdb/movie/<int:movie_id>")
 def tmdb_movie(movie_id: int):
@@ -1579,31 +3294,65 @@ def tmdb_movie(movie_id: int):
     if err:
         return jsonify({"error": err}), 400
 
-    url = f"https://api.themoviedb.org/3/movie/{movie_id}"
-    params = {"language": tmdb_language()}
-    r = requests.get(url, headers=headers, params=params, timeout=10)
-    if r.status_code != 200:
-        return jsonify({"error": f"TMDB-detaljer misslyckades ({r.status_code})"}), 502
+    status, j = _tmdb_movie(movie_id, headers, tmdb_language())
+    if status != 200:
+        return jsonify({"error": f"TMDB-detaljer misslyckades ({status})"}), 502
 
-    j = r.json()
     title = j.get("title") or ""
     date = j.get("release_date") or ""
     year = date.split("-")[0] if date else ""
     return jsonify({"title": title, "year": year})
 
+def _apply_details(payload: dict, details: dict):
+    # TMDB:s betyg vinner, annars behålls det som ligger i DB
+    db_vote = payload["vote"]
+    payload.update(details)
+    if payload["vote"] is None:
+        payload["vote"] = db_vote
+
+def _movie_etag(movie_row_id: int, language: str):
+    # Revision + när TMDB-detaljerna senast hämtades (bakgrundsförnyelse ändrar svaret).
+    # None för TMDB-filmer utan hämtade detaljer: svaret ska inte valideras som
+    # oförändrat utan nästa öppning försöker hämta igen.
+    rev, _ = library_revision()
+    with db() as conn:
+        row = conn.execute(
+            "SELECT m.tmdb_id, tc.fetched_at FROM movies m LEFT JOIN tmdb_cache tc ON tc.tmdb_id = m.tmdb_id AND tc.language = ? WHERE m.id = ?",
+            (language, movie_row_id)
+        ).fetchone()
+    if not row or (row[0] and row[1] is None):
+        return None
+    raw = f"{movie_row_id}|{rev}|{language}|{row[1]}"
+    return "movie-" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def _movie_response(payload: dict, etag: str):
+    if not etag:
+        # TMDB-detaljerna kunde inte hämtas (fel eller token saknas): inget att validera mot
+        resp = jsonify(payload)
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+    return _validators(jsonify(payload), etag)
+
 @app.route("/movie/<int:movie_row_id>")
 def movie_details(movie_row_id: int):
+    language = tmdb_language()
+    etag = _movie_etag(movie_row_id, language)
+    if etag:
+        resp = _not_modified(etag)
+        if resp is not None:
+            return resp
+
     # Hämta från DB
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, title, format, year, poster_file, vote, tmdb_id, watched FROM movies WHERE id=?", (movie_row_id,))
-    row = c.fetchone()
-    conn.close()
+    with db() as conn:
+        row = conn.execute(
+            "SELECT id, title, format, year, poster_file, vote, tmdb_id, watched, poster_width FROM movies WHERE id=?",
+            (movie_row_id,)
+        ).fetchone()
 
     if not row:
         return jsonify({"error": "Not found"}), 404
 
-    _id, title, fmt, year, poster_file, vote, tmdb_id, watched = row
+    _id, title, fmt, year, poster_file, vote, tmdb_id, watched, poster_width = row
 
     payload = {
         "id": _id,
@@ -1611,6 +3360,7 @@ def movie_details(movie_row_id: int):
         "format": fmt,
         "year": year,
         "poster_local": f"poster/{poster_file}" if poster_file else None,
+        "poster_width": poster_width,
         "vote": vote,
         "tmdb_id": tmdb_id,
         "overview": None,
@@ -1624,30 +3374,681 @@ def movie_details(movie_row_id: int):
     if tmdb_id:
         cached = _cache_get(int(tmdb_id))
         if cached is not None and cached.get("details"):
-            payload.update(cached["details"])
-            return jsonify(payload)
+            _apply_details(payload, cached["details"])
+            return _movie_response(payload, etag)
 
         headers, err = tmdb_headers()
+        stored = _pcache_get(int(tmdb_id), language)
+        if stored is not None:
+            details, fresh = stored
+            _apply_details(payload, details)
+            if fresh:
+                _cache_set(int(tmdb_id), {"runtime": details.get("runtime"), "details": details})
+            elif not err:
+                _refresh_in_background(int(tmdb_id), headers, language)
+            return _movie_response(payload, etag)
+
         if not err:
-            url = f"https://api.themoviedb.org/3/movie/{int(tmdb_id)}"
-            params = {"language": tmdb_language()}
-            r = requests.get(url, headers=headers, params=params, timeout=10)
-            if r.status_code == 200:
-                j = r.json()
-                details = {
-                    "overview": (j.get("overview") or "").strip() or None,
-                    "runtime": j.get("runtime"),
-                    "release_date": j.get("release_date"),
-                    "genres": [g.get("name") for g in (j.get("genres") or []) if g.get("name")],
-                    "vote": j.get("vote_average") if j.get("vote_average") is not None else payload["vote"],
-                }
-                payload.update(details)
-                _cache_set(int(tmdb_id), {"details": details}, ttl_seconds=3600)
-
-    return jsonify(payload)
+            details = _fetch_details(int(tmdb_id), headers, language)
+            if details is not None:
+                _apply_details(payload, details)
+                etag = _movie_etag(movie_row_id, language)  # nu med fetched_at
+
+    return _movie_response(payload, etag)
+
+
+# ===== Bulkimport =====
+# CSV (title/year/format/imdb_id/tmdb_id/watched), Letterboxd-export och
+# DVD Profiler XML. Filen tolkas strömmande till import_rows, raderna matchas
+# mot TMDB parallellt och läggs in batchvis. Allt läge ligger i databasen så
+# ett jobb fortsätter där det var efter en omstart.
+IMPORT_DIR = POSTERS_DIR.parent / "imports"
+IMPORT_RATE = 20    # TMDB-anrop per sekund, delat av alla importtrådar
+IMPORT_BATCH = 200  # rader per matchningsomgång/transaktion
+IMPORT_CANDIDATES = 5
+
+_IMDB_ID = re.compile(r"tt\d{7,}")
+DVDPROFILER_MEDIA = (("UltraHD", "4K UHD"), ("BluRay", "Blu-ray"), ("HDDVD", "HD DVD"), ("DVD", "DVD"))
+
+class RateLimiter:
+    """Token bucket: högst rate anrop/s i snitt, med burst upp till rate."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.stamp = monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            sleep(delay)
+
+_import_limiter = RateLimiter(IMPORT_RATE)
+_import_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="import")  # ett jobb i taget
+_import_match_pool = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import-match")
+
+def _int_or_none(v):
+    v = (v or "").strip()
+    return int(v) if v.isdigit() else None
+
+def _detect_import_kind(path: Path) -> str:
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        head = f.read(4096)
+    if head.lstrip().startswith("<"):
+        return "dvdprofiler"
+    first = head.splitlines()[0] if head else ""
+    return "letterboxd" if "letterboxd uri" in first.lower() else "csv"
+
+def _parse_csv(path: Path, default_fmt: str, watched):
+    """Vanlig CSV, IMDb-export (Const) och Letterboxd (Name, Year)."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for rec in csv.DictReader(f):
+            rec = {k.strip().lower().replace(" ", "_"): (v or "").strip() for k, v in rec.items() if k}
+            imdb = _IMDB_ID.search(rec.get("imdb_id") or rec.get("imdb") or rec.get("const") or "")
+            w = rec.get("watched", "").lower()
+            yield {
+                "title": rec.get("title") or rec.get("name") or "",
+                "year": _int_or_none(rec.get("year")),
+                "fmt": rec.get("format") or default_fmt,
+                "watched": watched if watched is not None else int(w in ("1", "true", "yes", "ja", "x")),
+                "imdb_id": imdb.group(0) if imdb else None,
+                "tmdb_id": _int_or_none(rec.get("tmdb_id") or rec.get("tmdb")),
+            }
+
+def _parse_dvdprofiler(path: Path, default_fmt: str, watched):
+    # <Collection><DVD><Title/><ProductionYear/><MediaTypes><DVD>true</DVD>...
+    # MediaTypes har också <DVD>, men den saknar barn.
+    for _event, el in ET.iterparse(path, events=("end",)):
+        if el.tag != "DVD" or len(el) == 0:
+            continue
+        media = el.find("MediaTypes")
+        fmts = [name for tag, name in DVDPROFILER_MEDIA
+                if media is not None and (media.findtext(tag) or "").lower() == "true"]
+        yield {
+            "title": (el.findtext("Title") or el.findtext("OriginalTitle") or "").strip(),
+            "year": _int_or_none(el.findtext("ProductionYear")),
+            "fmt": ", ".join(fmts) or default_fmt,
+            "watched": watched or 0,
+            "imdb_id": None,
+            "tmdb_id": None,
+        }
+        el.clear()  # håll minnet konstant för stora samlingar
+
+def _import_parse(job_id: int, kind: str, path: Path, default_fmt: str, watched):
+    if kind == "dvdprofiler":
+        records = _parse_dvdprofiler(path, default_fmt, watched)
+    else:
+        if kind == "letterboxd" and watched is None:
+            watched = 1  # watched/diary-export; skicka watched=0 för watchlist
+        records = _parse_csv(path, default_fmt, watched)
+
+    sql = ("INSERT INTO import_rows (job_id, line, title, year, fmt, watched, imdb_id, tmdb_id, status) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending')")
+    with db() as conn:
+        conn.execute("DELETE FROM import_rows WHERE job_id = ?", (job_id,))  # avbruten tolkning
+        batch = []
+        for line, r in enumerate(records, 1):
+            if not (r["title"] or r["imdb_id"] or r["tmdb_id"]):
+                continue
+            batch.append((job_id, line, r["title"], r["year"], r["fmt"], r["watched"], r["imdb_id"], r["tmdb_id"]))
+            if len(batch) >= 500:
+                conn.executemany(sql, batch)
+                batch.clear()
+        conn.executemany(sql, batch)
+        conn.execute("UPDATE import_jobs SET parsed = 1, updated_at = ? WHERE id = ?", (time(), job_id))
+        conn.commit()
+
+def _release_year(m: dict):
+    d = m.get("release_date") or ""
+    return int(d[:4]) if d[:4].isdigit() else None
+
+def _pick_candidate(title: str, year, results: list):
+    """(status, film eller kandidater) för ett sökresultat."""
+    if not results:
+        return "unmatched", None
+    want = fold(title)
+    exact = [m for m in results if want in (fold(m.get("title") or ""), fold(m.get("original_title") or ""))]
+    if year:
+        same_year = [m for m in exact if _release_year(m) == year]
+        if len(same_year) == 1:
+            return "matched", same_year[0]
+        exact = [m for m in exact if _release_year(m) and abs(_release_year(m) - year) <= 1]
+    if len(exact) == 1:
+        return "matched", exact[0]
+    if len(results) == 1 and (not year or _release_year(results[0]) == year):
+        return "matched", results[0]
+    return "ambiguous", [
+        {"tmdb_id": m.get("id"), "title": m.get("title"), "original_title": m.get("original_title"),
+         "year": _release_year(m)}
+        for m in (exact or results)[:IMPORT_CANDIDATES]
+    ]
+
+class ImportStopped(Exception):
+    """Processen stängs; jobbet ligger kvar och återupptas vid nästa start."""
+
+def _tmdb_import_get(path: str, headers: dict, params: dict):
+    if _shutting_down.is_set():
+        raise ImportStopped()
+    _import_limiter.acquire()
+    return tmdb.get(path, headers, params)
+
+def _match_import_row(row, headers: dict, language: str):
+    _line, title, year, _fmt, _watched, imdb_id, tmdb_id = row
+    try:
+        if tmdb_id:
+            r = _tmdb_import_get(f"/movie/{tmdb_id}", headers,
+                                 {"language": language, "append_to_response": "alternative_titles"})
+            if r.status_code == 404:
+                return "unmatched", None
+            return ("matched", r.json()) if r.status_code == 200 else ("error", None)
+
+        if imdb_id:
+            r = _tmdb_import_get(f"/find/{imdb_id}", headers, {"external_source": "imdb_id", "language": language})
+            if r.status_code != 200:
+                return "error", None
+            hits = r.json().get("movie_results") or []
+            if hits:
+                return "matched", hits[0]
+
+        if not title:
+            return "unmatched", None
+        params = {"query": title, "language": language, "include_adult": "false"}
+        if year:
+            params["primary_release_year"] = year
+        r = _tmdb_import_get("/search/movie", headers, params)
+        if r.status_code != 200:
+            return "error", None
+        results = r.json().get("results") or []
+        if not results and year:
+            # Utgivningsåret i samlingen skiljer ofta ett år från TMDB:s
+            params.pop("primary_release_year")
+            r = _tmdb_import_get("/search/movie", headers, params)
+            if r.status_code != 200:
+                return "error", None
+            results = r.json().get("results") or []
+        return _pick_candidate(title, year, results)
+    except requests.RequestException:
+        return "error", None
+
+def _store_import_batch(job_id: int, rows: list, results: list):
+    updates, inserts, seen = [], [], set()
+    with db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        ids = [m.get("id") for status, m in results if status == "matched"]
+        existing = set()
+        if ids:
+            existing = {r[0] for r in conn.execute(
+                f"SELECT tmdb_id FROM movies WHERE tmdb_id IN ({','.join('?' * len(ids))})", ids
+            )}
+
+        for row, (status, found) in zip(rows, results):
+            line, title, year, fmt, watched = row[:5]
+            tmdb_id = row[6]
+            candidates = None
+            if status == "matched":
+                tmdb_id = found.get("id")
+                if tmdb_id in existing or tmdb_id in seen:
+                    status = "duplicate"
+                else:
+                    seen.add(tmdb_id)
+                    status = "added"
+                    new_title = (found.get("title") or title or "").strip()
+                    original_title = (found.get("original_title") or "").strip() or None
+                    # Sökträffar saknar alternativa titlar; de fylls i av backfill_titles
+                    inserts.append((
+                        new_title, fmt, _release_year(found) or year, tmdb_id, found.get("vote_average"),
+                        original_title, _alt_titles(found, new_title, original_title),
+                        watched, found.get("poster_path") or None,
+                    ))
+            elif status == "ambiguous":
+                candidates = json.dumps(found, ensure_ascii=False)
+            updates.append((status, tmdb_id, candidates, job_id, line))
+
+        conn.executemany(
+            "INSERT OR IGNORE INTO movies (title, format, year, tmdb_id, vote, original_title, alt_titles, "
+            "watched, poster_pending, added_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))",
+            inserts
+        )
+        _fold_pending(conn)
+        if seen:
+            # Ignorerade rader (t.ex. manuell post med samma titel/år/format) är dubbletter
+            placeholders = ",".join("?" * len(seen))
+            added = {r[0] for r in conn.execute(
+                f"SELECT tmdb_id FROM movies WHERE tmdb_id IN ({placeholders})", list(seen)
+            )}
+            updates = [("duplicate" if u[0] == "added" and u[1] not in added else u[0],) + u[1:] for u in updates]
+            seen &= added
+        conn.executemany(
+            "UPDATE import_rows SET status = ?, tmdb_id = ?, candidates = ? WHERE job_id = ? AND line = ?",
+            updates
+        )
+        conn.execute("UPDATE import_jobs SET updated_at = ? WHERE id = ?", (time(), job_id))
+        conn.commit()
+
+        pending = []
+        if seen:
+            pending = conn.execute(
+                f"SELECT id, tmdb_id, poster_pending FROM movies "
+                f"WHERE poster_pending IS NOT NULL AND tmdb_id IN ({','.join('?' * len(seen))})",
+                list(seen)
+            ).fetchall()
+    for row_id, tmdb_id, poster_path in pending:
+        queue_poster_download(row_id, tmdb_id, poster_path)
+
+def _set_import_status(job_id: int, status: str, error: str = None):
+    with db() as conn:
+        conn.execute(
+            "UPDATE import_jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, error, time(), job_id)
+        )
+        conn.commit()
 
+def _run_import(job_id: int):
+    with db() as conn:
+        job = conn.execute(
+            "SELECT kind, source, fmt, watched, parsed FROM import_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    if not job:
+        return
+    kind, source, fmt, watched, parsed = job
+    try:
+        if not parsed:
+            _set_import_status(job_id, "parsing")
+            _import_parse(job_id, kind, Path(source), fmt, watched)
 
-if __name__ == "__main__":
+        headers, err = tmdb_headers()
+        if err:
+            _set_import_status(job_id, "failed", err)
+            return
+        language = tmdb_language()
+
+        _set_import_status(job_id, "matching")
+        with db() as conn:
+            # Nätverksfel från förra körningen får ett nytt försök
+            conn.execute("UPDATE import_rows SET status = 'pending' WHERE job_id = ? AND status = 'error'", (job_id,))
+            conn.commit()
+
+        while True:
+            with db() as conn:
+                rows = conn.execute(
+                    "SELECT line, title, year, fmt, watched, imdb_id, tmdb_id FROM import_rows "
+                    "WHERE job_id = ? AND status = 'pending' ORDER BY line LIMIT ?",
+                    (job_id, IMPORT_BATCH)
+                ).fetchall()
+            if not rows:
+                break
+            results = list(_import_match_pool.map(lambda r: _match_import_row(r, headers, language), rows))
+            _store_import_batch(job_id, rows, results)
+
+        _set_import_status(job_id, "done")
+        Path(source).unlink(missing_ok=True)
+    except (ImportStopped, CancelledError):
+        pass
+    except Exception as e:
+        # Fel som orsakas av nedstängningen ska inte låsa jobbet som misslyckat
+        if not _shutting_down.is_set():
+            _set_import_status(job_id, "failed", str(e))
+
+def queue_import(job_id: int):
+    _import_runner.submit(_run_import, job_id)
+
+def resume_import_jobs():
+    # Jobb som avbröts av en omstart fortsätter från import_rows
+    with db() as conn:
+        jobs = conn.execute(
+            "SELECT id FROM import_jobs WHERE status NOT IN ('done', 'failed') ORDER BY id"
+        ).fetchall()
+    for (job_id,) in jobs:
+        queue_import(job_id)
+
+def backfill_titles():
+    """Hämtar originaltitel och alternativa titlar för TMDB-filmer som saknar dem.
+
+    Gäller rader från före titelsökningen, /add med tmdb_id och importer som
+    matchades via sökning. Delar importens hastighetsgräns; avbryts vid nedstängning
+    och fortsätter vid nästa start."""
+    headers, err = tmdb_headers()
+    if err:
+        return
+    language = tmdb_language()
+    last_id = 0
+    try:
+        while True:
+            with db() as conn:
+                rows = conn.execute(
+                    "SELECT id, tmdb_id, title FROM movies "
+                    "WHERE tmdb_id IS NOT NULL AND alt_titles IS NULL AND id > ? ORDER BY id LIMIT ?",
+                    (last_id, IMPORT_BATCH)
+                ).fetchall()
+            if not rows:
+                return
+            for row_id, tmdb_id, title in rows:
+                last_id = row_id
+                try:
+                    r = _tmdb_import_get(f"/movie/{tmdb_id}", headers,
+                                         {"language": language, "append_to_response": "alternative_titles"})
+                except requests.RequestException:
+                    return  # TMDB nås inte; nytt försök vid nästa start
+                if r.status_code == 404:
+                    original_title, alt_titles = None, ""  # finns inte längre; försök inte igen
+                elif r.status_code == 200:
+                    j = r.json()
+                    original_title = (j.get("original_title") or "").strip() or None
+                    alt_titles = _alt_titles(j, title, original_title) or ""
+                else:
+                    return
+                with db() as conn:
+                    conn.execute(
+                        "UPDATE movies SET original_title = IFNULL(original_title, ?), alt_titles = ? "
+                        "WHERE id = ? AND alt_titles IS NULL",
+                        (original_title, alt_titles, row_id)
+                    )
+                    _fold_pending(conn)
+                    conn.commit()
+    except ImportStopped:
+        pass
+
+def _import_summary(job_id: int):
+    with db() as conn:
+        job = conn.execute(
+            "SELECT id, kind, status, error, created_at, updated_at FROM import_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if not job:
+            return None
+        counts = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM import_rows WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall())
+    return {
+        "id": job[0],
+        "kind": job[1],
+        "status": job[2],
+        "error": job[3],
+        "created_at": job[4],
+        "updated_at": job[5],
+        "total": sum(counts.values()),
+        "counts": counts,
+    }
+
+@app.route("/import", methods=["POST"])
+def import_start():
+    f = request.files.get("file")
+    if not f or not f.filename:
+        return jsonify({"error": "Ingen fil skickades."}), 400
+
+    fmt = (request.form.get("format") or "Blu-ray").strip()
+    watched = request.form.get("watched", "")
+    watched = int(watched) if watched in ("0", "1") else None
+
+    IMPORT_DIR.mkdir(parents=True, exist_ok=True)
+    with db() as conn:
+        cur = conn.execute(
+            "INSERT INTO import_jobs (kind, source, fmt, watched, status, created_at, updated_at) "
+            "VALUES ('', '', ?, ?, 'queued', ?, ?)",
+            (fmt, watched, time(), time())
+        )
+        job_id = cur.lastrowid
+        conn.commit()
+
+    source = IMPORT_DIR / f"{job_id}{Path(secure_filename(f.filename)).suffix.lower()}"
+    f.save(source)
+    kind = request.form.get("kind") or _detect_import_kind(source)
+    if kind not in ("csv", "letterboxd", "dvdprofiler"):
+        kind = _detect_import_kind(source)
+    with db() as conn:
+        conn.execute("UPDATE import_jobs SET kind = ?, source = ? WHERE id = ?", (kind, str(source), job_id))
+        conn.commit()
+
+    queue_import(job_id)
+    return jsonify({"job": job_id, "kind": kind, "status": "queued"}), 202
+
+@app.route("/import/<int:job_id>")
+def import_status(job_id: int):
+    summary = _import_summary(job_id)
+    if summary is None:
+        return jsonify({"error": "Okänt importjobb."}), 404
+    return jsonify(summary)
+
+@app.route("/import/<int:job_id>/review")
+def import_review(job_id: int):
+    """Rader som behöver ett beslut: tvetydiga (med kandidater), omatchade och fel."""
+    with db() as conn:
+        rows = conn.execute(
+            "SELECT line, title, year, fmt, imdb_id, status, candidates FROM import_rows "
+            "WHERE job_id = ? AND status IN ('ambiguous', 'unmatched', 'error') ORDER BY line",
+            (job_id,)
+        ).fetchall()
+    return jsonify({
+        "job": job_id,
+        "rows": [{
+            "line": r[0],
+            "title": r[1],
+            "year": r[2],
+            "format": r[3],
+            "imdb_id": r[4],
+            "status": r[5],
+            "candidates": json.loads(r[6]) if r[6] else [],
+        } for r in rows],
+    })
+
+@app.route("/import/<int:job_id>/rows/<int:line>", methods=["POST"])
+def import_resolve(job_id: int, line: int):
+    # Välj TMDB-id för en granskad rad (tomt = hoppa över); jobbet körs vidare
+    tmdb_id = (request.form.get("tmdb_id") or "").strip()
+    status = "pending" if tmdb_id.isdigit() else "skipped"
+    with db() as conn:
+        cur = conn.execute(
+            "UPDATE import_rows SET status = ?, tmdb_id = ?, candidates = NULL "
+            "WHERE job_id = ? AND line = ? AND status IN ('ambiguous', 'unmatched', 'error')",
+            (status, int(tmdb_id) if tmdb_id.isdigit() else None, job_id, line)
+        )
+        if cur.rowcount and status == "pending":
+            conn.execute("UPDATE import_jobs SET status = 'queued', error = NULL WHERE id = ?", (job_id,))
+        conn.commit()
+    if not cur.rowcount:
+        return jsonify({"error": "Raden finns inte eller är redan klar."}), 404
+    if status == "pending":
+        queue_import(job_id)
+    return jsonify({"status": status})
+
+@app.route("/import/<int:job_id>/resume", methods=["POST"])
+def import_resume(job_id: int):
+    if _import_summary(job_id) is None:
+        return jsonify({"error": "Okänt importjobb."}), 404
+    _set_import_status(job_id, "queued")
+    queue_import(job_id)
+    return jsonify({"status": "queued"}), 202
+
+
+# ===== Export och backup =====
+# Allt strömmas från generatorer: raderna direkt från en DB-cursor och
+# backupen som tar, block för block. Läsningar i WAL-läge blockerar inte
+# skrivare, så appen fungerar som vanligt under en export.
+EXPORT_COLUMNS = (
+    "id", "title", "original_title", "alt_titles", "format", "year", "tmdb_id",
+    "vote", "watched", "added_at", "poster_file",
+)
+EXPORT_FETCH = 500
+BACKUP_CHUNK = 256 * 1024
+
+def _export_rows():
+    with db() as conn:
+        cur = conn.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM movies ORDER BY id")
+        try:
+            while True:
+                rows = cur.fetchmany(EXPORT_FETCH)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
+def _export_ndjson():
+    for rows in _export_rows():
+        yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, r)), ensure_ascii=False) + "\n" for r in rows)
+
+def _export_csv():
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(EXPORT_COLUMNS)
+    for rows in _export_rows():
+        w.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()  # bara rubriken om biblioteket är tomt
+
+@app.route("/export")
+def export_movies():
+    fmt = request.args.get("format", "ndjson")
+    if fmt == "csv":
+        body, mimetype = _export_csv(), "text/csv"
+    elif fmt == "ndjson":
+        body, mimetype = _export_ndjson(), "application/x-ndjson"
+    else:
+        return jsonify({"error": "format måste vara ndjson eller csv"}), 400
+    resp = Response(body, mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="movies.{fmt}"'
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+def _tar_member(name: str, f, size: int, mtime: float):
+    """En tar-post: header, innehåll i bitar och utfyllnad till 512 byte."""
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    yield info.tobuf(tarfile.PAX_FORMAT)
+    left = size
+    while left > 0:
+        chunk = f.read(min(BACKUP_CHUNK, left))
+        if not chunk:
+            chunk = b"\0" * min(BACKUP_CHUNK, left)  # filen krympte under läsningen
+        yield chunk
+        left -= len(chunk)
+    if size % tarfile.BLOCKSIZE:
+        yield b"\0" * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE)
+
+def _tar_file(name: str, path: Path):
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return  # borttagen sedan katalogen listades
+    with f:
+        st = os.fstat(f.fileno())
+        yield from _tar_member(name, f, st.st_size, st.st_mtime)
+
+def _backup_tar():
+    # Ögonblicksbild av databasen: VACUUM INTO läser i en egen transaktion
+    snapshot = Path(f"{DB_PATH}.backup-{os.getpid()}-{threading.get_ident()}")
+    snapshot.unlink(missing_ok=True)
+    try:
+        with db() as conn:
+            conn.execute("VACUUM INTO ?", (str(snapshot),))
+        yield from _tar_file("movies.db", snapshot)
+        snapshot.unlink(missing_ok=True)
+
+        # Originalen räcker; varianterna skapas igen vid behov (se poster())
+        if POSTERS_DIR.is_dir():
+            for root, dirs, files in os.walk(POSTERS_DIR):
+                dirs[:] = sorted(d for d in dirs if d != "variants")
+                for name in sorted(files):
+                    if name.startswith("."):
+                        continue  # .part/.tmp under nedladdning
+                    path = Path(root) / name
+                    yield from _tar_file(f"posters/{path.relative_to(POSTERS_DIR).as_posix()}", path)
+        yield b"\0" * (tarfile.BLOCKSIZE * 2)
+    finally:
+        snapshot.unlink(missing_ok=True)
+
+@app.route("/backup")
+def backup():
+    resp = Response(_backup_tar(), mimetype="application/x-tar")
+    stamp = datetime.now().strftime("%Y%m%d-%H%M")
+    resp.headers["Content-Disposition"] = f'attachment; filename="movie_library-{stamp}.tar"'
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+# ===== Server =====
+# Produktion: gunicorn med gthread-workers (processer x trådar). Databasen
+# migreras i huvudprocessen innan workers forkas; bakgrundsjobben körs i
+# den worker som först får låsfilen, så de inte dubbleras.
+GRACEFUL_TIMEOUT = 8  # Supervisor väntar 10 s på stopp innan SIGKILL
+KEEPALIVE = 5
+
+_background_lock = None
+
+def _background_worker():
+    prune_tmdb_cache()
+    migrate_posters()
+    resume_poster_downloads()
+    resume_import_jobs()
+    backfill_titles()
+
+def start_background_tasks():
+    global _background_lock
+    POSTERS_DIR.parent.mkdir(parents=True, exist_ok=True)
+    f = open(POSTERS_DIR.parent / ".background.lock", "w")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()  # en annan worker har redan hand om dem
+        return
+    _background_lock = f  # låset hålls så länge processen lever
+    threading.Thread(target=_background_worker, name="background", daemon=True).start()
+
+def stop_background_tasks():
+    # Köade nedladdningar och importer ligger kvar i databasen och tas upp vid nästa start
+    _shutting_down.set()
+    for pool in (_poster_pool, _import_runner, _enrich_pool, _warm_pool):
+        pool.shutdown(wait=False, cancel_futures=True)
+    # Matchningspoolen töms inte under en pågående import; raderna avbryts
+    # själva med ImportStopped och blir kvar som 'pending'
+    _import_match_pool.shutdown(wait=False)
+
+def serve():
+    opts = options()
     os.makedirs("/config", exist_ok=True)
     init_db()
-    app.run(host="0.0.0.0", port=5000)
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        BaseApplication = None
+    if opts.server == "development" or BaseApplication is None:
+        start_background_tasks()
+        app.run(host="0.0.0.0", port=5000, threaded=True)
+        return
+
+    settings = {
+        "bind": "0.0.0.0:5000",
+        "workers": opts.workers,
+        "worker_class": "gthread",
+        "threads": opts.threads,
+        "timeout": opts.worker_timeout,  # tyst worker startas om
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "keepalive": KEEPALIVE,
+        "post_worker_init": lambda worker: start_background_tasks(),
+        "worker_exit": lambda server, worker: stop_background_tasks(),
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "movie_library"))
+import app  # noqa: E402
+
+
+def drain_pool():
+    while not app._db_pool.empty():
+        app._db_pool.get_nowait().close()
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    """Tom databas och posterkatalog i tmp_path."""
+    drain_pool()
+    monkeypatch.setattr(app, "DB_PATH", str(tmp_path / "movies.db"))
+    monkeypatch.setattr(app, "POSTERS_DIR", tmp_path / "posters")
+    app.init_db()
+    drain_pool()
+    yield app
+    drain_pool()
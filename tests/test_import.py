@@ -0,0 +1,224 @@
+import json
+from time import time
+
+import pytest
+
+import app
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+def _movie(movie_id, title, year, **extra):
+    return {"id": movie_id, "title": title, "release_date": f"{year}-05-01", "vote_average": 7.0, **extra}
+
+
+@pytest.fixture
+def tmdb(library, monkeypatch):
+    """Stubbar TMDB: routes[(path, query)] -> FakeResponse; anropen sparas i calls."""
+    routes, calls = {}, []
+
+    def get(path, headers, params=None):
+        calls.append((path, dict(params or {})))
+        key = (path, (params or {}).get("query"))
+        return routes.get(key) or routes.get((path, None)) or FakeResponse(404)
+
+    monkeypatch.setattr(app.tmdb, "get", get)
+    monkeypatch.setattr(app, "tmdb_headers", lambda: ({"Authorization": "Bearer x"}, None))
+    monkeypatch.setattr(app, "tmdb_language", lambda: "sv-SE")
+    return routes, calls
+
+
+def _create_job(tmp_path, kind, content, fmt="Blu-ray", watched=None):
+    source = tmp_path / f"import.{'xml' if kind == 'dvdprofiler' else 'csv'}"
+    source.write_text(content, encoding="utf-8")
+    with app.db() as conn:
+        job_id = conn.execute(
+            "INSERT INTO import_jobs (kind, source, fmt, watched, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+            (kind, str(source), fmt, watched, time(), time())
+        ).lastrowid
+        conn.commit()
+    return job_id, source
+
+
+def _rows(job_id):
+    with app.db() as conn:
+        return conn.execute(
+            "SELECT line, title, year, fmt, watched, imdb_id, tmdb_id, status FROM import_rows "
+            "WHERE job_id = ? ORDER BY line", (job_id,)
+        ).fetchall()
+
+
+def _job_status(job_id):
+    with app.db() as conn:
+        return conn.execute("SELECT status, error FROM import_jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+# ----- Tolkning -----
+
+def test_parse_csv(tmp_path):
+    path = tmp_path / "movies.csv"
+    path.write_text(
+        "Title,Year,Format,IMDb ID,TMDB,Watched\n"
+        "Alien,1979,4K UHD,https://www.imdb.com/title/tt0078748/,,ja\n"
+        "Heat,,,,949,0\n"
+        ",,,,,\n",
+        encoding="utf-8",
+    )
+    assert list(app._parse_csv(path, "DVD", None)) == [
+        {"title": "Alien", "year": 1979, "fmt": "4K UHD", "watched": 1, "imdb_id": "tt0078748", "tmdb_id": None},
+        {"title": "Heat", "year": None, "fmt": "DVD", "watched": 0, "imdb_id": None, "tmdb_id": 949},
+        {"title": "", "year": None, "fmt": "DVD", "watched": 0, "imdb_id": None, "tmdb_id": None},
+    ]
+
+
+def test_parse_letterboxd(tmp_path):
+    path = tmp_path / "watched.csv"
+    path.write_text(
+        "Date,Name,Year,Letterboxd URI\n"
+        "2024-01-02,Amélie,2001,https://boxd.it/abc\n",
+        encoding="utf-8",
+    )
+    assert app._detect_import_kind(path) == "letterboxd"
+    assert list(app._parse_csv(path, "Blu-ray", 1)) == [
+        {"title": "Amélie", "year": 2001, "fmt": "Blu-ray", "watched": 1, "imdb_id": None, "tmdb_id": None},
+    ]
+
+
+def test_parse_dvdprofiler(tmp_path):
+    path = tmp_path / "collection.xml"
+    path.write_text(
+        "<Collection>"
+        "<DVD><Title>Alien</Title><ProductionYear>1979</ProductionYear>"
+        "<MediaTypes><DVD>false</DVD><BluRay>true</BluRay><UltraHD>true</UltraHD></MediaTypes></DVD>"
+        "<DVD><OriginalTitle>Le Samouraï</OriginalTitle><MediaTypes><DVD>true</DVD></MediaTypes></DVD>"
+        "<DVD><Title>Okänt</Title></DVD>"
+        "</Collection>",
+        encoding="utf-8",
+    )
+    assert app._detect_import_kind(path) == "dvdprofiler"
+    assert [(r["title"], r["year"], r["fmt"]) for r in app._parse_dvdprofiler(path, "VHS", None)] == [
+        ("Alien", 1979, "4K UHD, Blu-ray"),
+        ("Le Samouraï", None, "DVD"),
+        ("Okänt", None, "VHS"),
+    ]
+
+
+def test_import_parse_skips_empty_rows(library, tmp_path):
+    job_id, source = _create_job(tmp_path, "csv", "title,year\nAlien,1979\n,\nHeat,1995\n")
+    app._import_parse(job_id, "csv", source, "DVD", None)
+    assert [(line, title, status) for line, title, *_rest, status in _rows(job_id)] == [
+        (1, "Alien", "pending"),
+        (3, "Heat", "pending"),
+    ]
+
+
+# ----- Kandidatval -----
+
+def test_pick_candidate_same_year_wins():
+    results = [_movie(1, "Dune", 1984), _movie(2, "Dune", 2021)]
+    assert app._pick_candidate("Dune", 2021, results) == ("matched", results[1])
+
+
+def test_pick_candidate_matches_original_title_and_folds():
+    results = [_movie(1, "The Samurai", 1967, original_title="Le Samouraï"), _movie(2, "Samurai Cop", 1991)]
+    assert app._pick_candidate("le samourai", 1967, results) == ("matched", results[0])
+
+
+def test_pick_candidate_single_result():
+    results = [_movie(7, "Something Else", 2001)]
+    assert app._pick_candidate("Whatever", None, results) == ("matched", results[0])
+    assert app._pick_candidate("Whatever", 1990, results)[0] == "ambiguous"
+
+
+def test_pick_candidate_ambiguous_without_year():
+    results = [_movie(1, "Dune", 1984), _movie(2, "Dune", 2021), _movie(3, "Dune Drifter", 2020)]
+    status, candidates = app._pick_candidate("Dune", None, results)
+    assert status == "ambiguous"
+    assert [c["tmdb_id"] for c in candidates] == [1, 2]
+    assert candidates[0] == {"tmdb_id": 1, "title": "Dune", "original_title": None, "year": 1984}
+
+
+def test_pick_candidate_no_results():
+    assert app._pick_candidate("Nothing", 2000, []) == ("unmatched", None)
+
+
+# ----- Batchar och körning -----
+
+def test_duplicate_tmdb_id_in_one_batch(library, tmp_path):
+    job_id, source = _create_job(tmp_path, "csv", "title,tmdb_id\nAlien,348\nAlien (Director's Cut),348\n")
+    app._import_parse(job_id, "csv", source, "DVD", None)
+    rows = [r[:7] for r in _rows(job_id)]
+    found = _movie(348, "Alien", 1979)
+    app._store_import_batch(job_id, rows, [("matched", found), ("matched", found)])
+
+    assert [(r[0], r[6], r[7]) for r in _rows(job_id)] == [(1, 348, "added"), (2, 348, "duplicate")]
+    with app.db() as conn:
+        assert conn.execute("SELECT title, tmdb_id, year FROM movies").fetchall() == [("Alien", 348, 1979)]
+
+
+def test_duplicate_of_existing_movie(library, tmp_path):
+    with app.db() as conn:
+        conn.execute("INSERT INTO movies (title, format, tmdb_id) VALUES ('Alien', 'DVD', 348)")
+        conn.commit()
+    job_id, source = _create_job(tmp_path, "csv", "title\nAlien\n")
+    app._import_parse(job_id, "csv", source, "DVD", None)
+    app._store_import_batch(job_id, [r[:7] for r in _rows(job_id)], [("matched", _movie(348, "Alien", 1979))])
+    assert _rows(job_id)[0][-1] == "duplicate"
+
+
+def test_run_import_matches_rows(tmdb, tmp_path):
+    routes, _calls = tmdb
+    routes[("/movie/949", None)] = FakeResponse(200, _movie(949, "Heat", 1995, original_title="Heat",
+                                                        alternative_titles={"titles": [{"title": "Heat – Fight"}]}))
+    routes[("/find/tt0078748", None)] = FakeResponse(200, {"movie_results": [_movie(348, "Alien", 1979)]})
+    routes[("/search/movie", "Dune")] = FakeResponse(200, {"results": [_movie(1, "Dune", 1984), _movie(2, "Dune", 2021)]})
+    routes[("/search/movie", "Nothing")] = FakeResponse(200, {"results": []})
+
+    job_id, source = _create_job(
+        tmp_path, "csv",
+        "title,year,imdb_id,tmdb_id\nHeat,,,949\nAlien,,tt0078748,\nDune,,,\nNothing,2000,,\n",
+    )
+    app._run_import(job_id)
+
+    assert _job_status(job_id) == ("done", None)
+    assert not source.exists()
+    assert [(r[1], r[6], r[7]) for r in _rows(job_id)] == [
+        ("Heat", 949, "added"),
+        ("Alien", 348, "added"),
+        ("Dune", None, "ambiguous"),
+        ("Nothing", None, "unmatched"),
+    ]
+    with app.db() as conn:
+        candidates = conn.execute("SELECT candidates FROM import_rows WHERE job_id = ? AND line = 3", (job_id,)).fetchone()[0]
+        movies = conn.execute("SELECT title, tmdb_id, alt_titles FROM movies ORDER BY tmdb_id").fetchall()
+    assert [c["tmdb_id"] for c in json.loads(candidates)] == [1, 2]
+    assert movies == [("Alien", 348, None), ("Heat", 949, "Heat – Fight")]
+
+
+def test_run_import_resumes_after_stop(tmdb, tmp_path):
+    routes, calls = tmdb
+    routes[("/movie/949", None)] = FakeResponse(200, _movie(949, "Heat", 1995))
+    job_id, source = _create_job(tmp_path, "csv", "title,tmdb_id\nHeat,949\n")
+
+    app._shutting_down.set()
+    try:
+        app._run_import(job_id)
+    finally:
+        app._shutting_down.clear()
+
+    # Avbrutet: raderna väntar fortfarande och jobbet är inte misslyckat
+    assert _job_status(job_id)[0] == "matching"
+    assert [r[-1] for r in _rows(job_id)] == ["pending"]
+    assert calls == []
+
+    app._run_import(job_id)
+    assert _job_status(job_id) == ("done", None)
+    assert [r[-1] for r in _rows(job_id)] == ["added"]
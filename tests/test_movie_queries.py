@@ -0,0 +1,45 @@
+import pytest
+
+import app
+from conftest import drain_pool
+
+CURSOR_KEYS = {"title": "Alien", "year": 1979, "rating": 7.5, "added_at": "2024-01-01 12:00:00"}
+
+
+@pytest.fixture
+def statements(library, monkeypatch):
+    """Samlar SQL-satserna (med bundna värden) som körs mot den tomma databasen."""
+    seen = []
+    open_db = app._open_db
+
+    def traced():
+        conn = open_db()
+        conn.set_trace_callback(seen.append)
+        return conn
+
+    monkeypatch.setattr(app, "_open_db", traced)
+    yield seen
+    drain_pool()
+
+
+def _plan(sql):
+    conn = app._open_db()
+    try:
+        return " | ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql))
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("direction", ["asc", "desc"])
+@pytest.mark.parametrize("with_cursor", [False, True], ids=["first", "cursor"])
+@pytest.mark.parametrize("sort", list(app.SORT_KEYS))
+def test_sort_uses_index(statements, sort, direction, with_cursor):
+    cursor = app._encode_cursor(CURSOR_KEYS[sort], 42) if with_cursor else None
+    app.query_movies(sort=sort, direction=direction, limit=50, cursor=cursor)
+
+    sql = next(s for s in statements if s.startswith("SELECT") and "FROM movies" in s)
+    plan = _plan(sql)
+    assert f"idx_movies_sort_{sort}" in plan, plan
+    assert "TEMP B-TREE" not in plan, plan
+    if with_cursor:
+        assert "SEARCH" in plan, plan